@@ -0,0 +1,202 @@
+"""Asyncio entry point for the chat server
+
+Runs the same Socket.IO protocol as server.py on python-socketio's
+AsyncServer behind an ASGI server. Requires uvicorn and asgiref:
+
+    uvicorn --factory asgi:create_app --host 0.0.0.0 --port 8080
+"""
+
+import asyncio
+import threading
+import contextvars
+
+import socketio
+import uvicorn
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from concurrent.futures import ThreadPoolExecutor
+from server import BaseChatServer, Config
+from store import MemoryRoomStore
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi running requests on a thread pool
+
+    asgiref runs every request of a wrapped WSGI app on one shared
+    thread, so a slow upload would hold up all other routes.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        instance = PooledWsgiToAsgiInstance(
+            self.wsgi_application, self.duplicate_header_limit, self.executor
+        )
+        await instance(scope, receive, send)
+
+
+class PooledWsgiToAsgiInstance(WsgiToAsgiInstance):
+    """One request of a PooledWsgiToAsgi app"""
+
+    # The synchronous body of asgiref's thread-sensitive run_wsgi_app
+    run_wsgi_app_sync = WsgiToAsgiInstance.__dict__["run_wsgi_app"].func
+
+    def __init__(self, wsgi_application, duplicate_header_limit, executor):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        run = sync_to_async(
+            self.run_wsgi_app_sync, thread_sensitive=False, executor=self.executor
+        )
+        await run(body)
+
+
+class AsyncChatServer(BaseChatServer):
+    """Chat server on asyncio with an ASGI front end"""
+
+    # Handlers that may block on image decoding run in the worker pool;
+    # with a shared store every handler does, as each makes round-trips
+    OFFLOADED_EVENTS = {"send_message"}
+
+    def __init__(self, host=None, port=None, store=None):
+        super().__init__(host, port, store)
+        client_manager = None
+        if Config.REDIS_URL:
+            client_manager = socketio.AsyncRedisManager(Config.REDIS_URL)
+
+        self.sio = socketio.AsyncServer(
+            async_mode="asgi",
+            cors_allowed_origins="*",
+            logger=True,
+            client_manager=client_manager,
+            serializer=self._serializer(),
+        )
+        self.asgi_app = socketio.ASGIApp(
+            self.sio,
+            other_asgi_app=self._http_app,
+            on_startup=self._startup,
+            on_shutdown=self._shutdown,
+        )
+        self.wsgi_app = PooledWsgiToAsgi(
+            self.app, ThreadPoolExecutor(max_workers=Config.HTTP_WORKERS)
+        )
+        self.offload_all = not isinstance(self.store, MemoryRoomStore)
+        self.executor = ThreadPoolExecutor(
+            max_workers=(
+                Config.HANDLER_WORKERS if self.offload_all else Config.IMAGE_WORKERS
+            )
+        )
+        self.sid_locks = {}
+        self.loop = None
+        self.outbox = None
+
+        self._setup_socket_handlers()
+
+    async def _startup(self):
+        """Restore saved rooms, start the outbound pump and background loops"""
+        self.loop = asyncio.get_running_loop()
+        if Config.SNAPSHOT_PATH:
+            await self.loop.run_in_executor(None, self._restore_snapshot)
+        self.outbox = asyncio.Queue()
+        self.loop.create_task(self._pump())
+        self._start_background_task(self.cleanup_scheduler.run)
+        if self.batcher:
+            self._start_background_task(self.batcher.run)
+        self._start_background_task(self.presence.run)
+
+    async def _shutdown(self):
+        """Drain before the process exits so rooms survive the restart"""
+        await self.loop.run_in_executor(None, self.drain)
+
+    async def _http_app(self, scope, receive, send):
+        """Serve Flask routes, each request in a fresh context
+
+        uvicorn may start the next keep-alive request from inside the
+        previous response's send, which would otherwise inherit asgiref's
+        executor for a WSGI thread that is about to finish.
+        """
+        await asyncio.create_task(
+            self.wsgi_app(scope, receive, send), context=contextvars.Context()
+        )
+
+    async def _pump(self):
+        """Apply queued transport operations in the order they were issued"""
+        while True:
+            operation, args = await self.outbox.get()
+            try:
+                await operation(*args)
+            except Exception:
+                self.logger.exception("Socket.IO operation failed")
+
+    def _queue(self, operation, *args):
+        """Queue a transport operation from the loop or a worker thread"""
+        self.loop.call_soon_threadsafe(self.outbox.put_nowait, (operation, args))
+
+    def _transport_emit(self, event, data, to, skip):
+        self._queue(self._send, event, data, to, skip)
+
+    async def _send(self, event, data, to, skip):
+        await self.sio.emit(event, data, to=to, skip_sid=skip)
+
+    def _room_backlogs(self, room_code):
+        return self._participant_backlogs(self.sio, room_code)
+
+    def _enter_room(self, sid, room_code):
+        self._queue(self.sio.enter_room, sid, room_code)
+
+    def _leave_room(self, sid, room_code):
+        self._queue(self.sio.leave_room, sid, room_code)
+
+    def _start_background_task(self, target, *args, **kwargs):
+        thread = threading.Thread(target=target, args=args, kwargs=kwargs)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _setup_socket_handlers(self):
+        """Setup Socket.IO event handlers"""
+        for event, handler in self._socket_handlers().items():
+            self.sio.on(event, self._bind_handler(event, handler))
+
+    def _bind_handler(self, event, handler):
+        """Adapt a protocol handler to an AsyncServer coroutine
+
+        Offloaded handlers of one connection run one at a time and in
+        arrival order, so a join is done before the next message.
+        """
+        takes_data = event not in ("connect", "disconnect")
+        offload = self.offload_all or event in self.OFFLOADED_EVENTS
+
+        async def socket_handler(sid, *args):
+            data = args[0] if takes_data and args else None
+            if not offload:
+                handler(sid, data)
+                return
+            lock = self.sid_locks.setdefault(sid, asyncio.Lock())
+            try:
+                async with lock:
+                    await self.loop.run_in_executor(self.executor, handler, sid, data)
+            finally:
+                if event == "disconnect":
+                    self.sid_locks.pop(sid, None)
+
+        return socket_handler
+
+    def start(self):
+        """Start the chat server"""
+        self._print_banner()
+        uvicorn.run(self.asgi_app, host=self.host, port=self.port)
+
+
+def create_app():
+    """ASGI application factory"""
+    return AsyncChatServer().asgi_app
+
+
+if __name__ == "__main__":
+    server = AsyncChatServer()
+    server.start()
@@ -0,0 +1,149 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+import posixpath
+
+from flask import Response, abort, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+class Asset:
+    """A static file held in memory with its precompressed variants"""
+
+    __slots__ = ("data", "etag", "mimetype", "encodings", "immutable")
+
+    def __init__(self, data, mimetype, immutable=False):
+        self.data = data
+        self.etag = hashlib.sha256(data).hexdigest()[:20]
+        self.mimetype = mimetype
+        self.encodings = {}
+        self.immutable = immutable
+
+
+class StaticAssets:
+    """Precompressed, content-hashed static files served from memory
+
+    Every file is available under its own name, revalidated on each use,
+    and under a hashed name such as css/chat.1a2b3c4d.css that is cached
+    for a year. References to other files in HTML attributes and CSS
+    url() values are rewritten to the hashed names, so pages pick up new
+    assets as soon as the HTML is revalidated.
+    """
+
+    CACHE_MAX_AGE = 31536000  # in seconds, for hashed names
+    MIN_COMPRESS_SIZE = 512  # in bytes
+    COMPRESSIBLE = {
+        "application/javascript",
+        "application/json",
+        "image/svg+xml",
+        "image/vnd.microsoft.icon",
+        "image/x-icon",
+    }
+    HTML_REFERENCE = re.compile(r'((?:href|src)=")([^"#?:]+)(")')
+    CSS_REFERENCE = re.compile(r"(url\(['\"]?)([^'\")#?:]+)(['\"]?\))")
+
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        self.hashed_names = {}
+        self._load()
+
+    def _load(self):
+        paths = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(directory, filename)
+                paths.append(os.path.relpath(full_path, self.root).replace(os.sep, "/"))
+
+        # Hash leaf files first so stylesheets and pages can point at them
+        order = {".css": 1, ".html": 2}
+        patterns = {".css": self.CSS_REFERENCE, ".html": self.HTML_REFERENCE}
+        paths.sort(key=lambda path: order.get(posixpath.splitext(path)[1], 0))
+
+        for path in paths:
+            extension = posixpath.splitext(path)[1]
+            with open(os.path.join(self.root, path), "rb") as f:
+                data = f.read()
+            if extension in patterns:
+                data = self._rewrite(path, data, patterns[extension])
+            self._add(path, data, hashed=extension != ".html")
+
+    def _rewrite(self, path, data, pattern):
+        base = posixpath.dirname(path)
+
+        def replace(match):
+            reference = match.group(2)
+            target = posixpath.normpath(posixpath.join(base, reference))
+            hashed = self.hashed_names.get(target)
+            if hashed is None:
+                return match.group(0)
+            reference = posixpath.join(
+                posixpath.dirname(reference), posixpath.basename(hashed)
+            )
+            return match.group(1) + reference + match.group(3)
+
+        return pattern.sub(replace, data.decode()).encode()
+
+    def _add(self, path, data, hashed):
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        asset = Asset(data, mimetype)
+        self._compress(asset)
+        self.assets[path] = asset
+
+        if hashed:
+            stem, extension = posixpath.splitext(path)
+            hashed_name = f"{stem}.{asset.etag[:8]}{extension}"
+            immutable = Asset(data, mimetype, immutable=True)
+            immutable.encodings = asset.encodings
+            self.assets[hashed_name] = immutable
+            self.hashed_names[path] = hashed_name
+
+    def _compress(self, asset):
+        compressible = (
+            asset.mimetype.startswith("text/") or asset.mimetype in self.COMPRESSIBLE
+        )
+        if not compressible or len(asset.data) < self.MIN_COMPRESS_SIZE:
+            return
+
+        candidates = {"gzip": gzip.compress(asset.data, 9, mtime=0)}
+        if brotli is not None:
+            candidates["br"] = brotli.compress(asset.data)
+        for encoding, data in candidates.items():
+            if len(data) < len(asset.data) * 0.9:
+                asset.encodings[encoding] = data
+
+    def hashed(self, path):
+        """Hashed name for a path, or the path itself if unknown"""
+        return self.hashed_names.get(path, path)
+
+    def serve(self, path):
+        """Respond with an asset, honouring Accept-Encoding and If-None-Match"""
+        asset = self.assets.get(path)
+        if asset is None:
+            abort(404)
+
+        encoding = None
+        for candidate in ("br", "gzip"):
+            if candidate in asset.encodings and candidate in request.accept_encodings:
+                encoding = candidate
+                break
+
+        data = asset.encodings[encoding] if encoding else asset.data
+        response = Response(data, mimetype=asset.mimetype)
+        response.set_etag(f"{asset.etag}-{encoding}" if encoding else asset.etag)
+        response.vary.add("Accept-Encoding")
+        if encoding:
+            response.content_encoding = encoding
+        if asset.immutable:
+            response.cache_control.public = True
+            response.cache_control.max_age = self.CACHE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
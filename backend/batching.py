@@ -0,0 +1,90 @@
+import time
+import logging
+import threading
+
+
+class BroadcastBatcher:
+    """Coalesces per-room broadcasts into batches
+
+    The first item added to an empty room buffer opens a window of
+    `window` seconds; everything added before it closes goes out in one
+    `flush(room, items)` call. A buffer reaching `max_batch` is closed
+    early and queued for the next pass. Only the flush loop emits, which
+    keeps batches for a room in order.
+    """
+
+    def __init__(self, flush, window=0.01, max_batch=50):
+        self.flush = flush
+        self.window = window
+        self.max_batch = max_batch
+        self.buffers = {}
+        self.deadlines = {}
+        self.ready = []
+        self.lock = threading.Lock()
+        self.running = False
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def pending(self):
+        """Number of buffered items"""
+        with self.lock:
+            buffered = sum(len(items) for items in self.buffers.values())
+            return buffered + sum(len(items) for _, items in self.ready)
+
+    def add(self, room, item):
+        """Buffer an item for a room"""
+        with self.lock:
+            items = self.buffers.get(room)
+            if items is None:
+                items = self.buffers[room] = []
+                self.deadlines[room] = time.monotonic() + self.window
+            items.append(item)
+            if len(items) >= self.max_batch:
+                self.ready.append((room, self._take(room)))
+
+    def _take(self, room):
+        self.deadlines.pop(room, None)
+        return self.buffers.pop(room)
+
+    def _flush(self, room, items):
+        try:
+            self.flush(room, items)
+        except Exception:
+            self.logger.exception(f"Broadcast to {room} failed")
+
+    def pop_due(self, now):
+        """Remove and return (room, items) pairs whose window has closed"""
+        with self.lock:
+            due = [room for room, deadline in self.deadlines.items() if deadline <= now]
+            batches, self.ready = self.ready, []
+            return batches + [(room, self._take(room)) for room in due]
+
+    def next_delay(self, now):
+        """Seconds until the next batch is due, at most one window"""
+        with self.lock:
+            if self.ready:
+                return 0
+            if not self.deadlines:
+                return self.window
+            return max(0, min(min(self.deadlines.values()) - now, self.window))
+
+    def run(self, sleep=time.sleep):
+        """Flush loop, meant to run as a background task
+
+        Polls with `sleep` rather than waiting on a lock, so a cooperative
+        sleep keeps it from blocking an eventlet or gevent hub.
+        """
+        self.running = True
+        while self.running:
+            for room, items in self.pop_due(time.monotonic()):
+                self._flush(room, items)
+            sleep(self.next_delay(time.monotonic()))
+
+    def stop(self):
+        """Flush everything buffered and stop the loop"""
+        with self.lock:
+            self.running = False
+            batches, self.ready = self.ready, []
+            batches += [(room, self._take(room)) for room in list(self.buffers)]
+        for room, items in batches:
+            self._flush(room, items)
@@ -0,0 +1,544 @@
+"""Load and latency benchmark for the WhisperChat Socket.IO protocol
+
+Starts a server in a subprocess, drives simulated clients through room
+creation, join, send and leave, and prints results as JSON:
+
+    python benchmark.py --clients 50 --rooms 5 --messages 20
+    python benchmark.py --target legacy --output legacy.json
+    python benchmark.py --target engine
+
+The engine target calls the shared room engine in-process, without a
+server or clients, to measure the core cost of posting and paging.
+
+Requires python-socketio[asyncio_client] (aiohttp), and msgpack for
+--wire-format msgpack.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import base64
+import asyncio
+import argparse
+import platform
+import subprocess
+import threading
+
+import aiohttp
+import socketio
+
+from PIL import Image
+from yarl import URL
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BACKEND_DIR)
+
+# Servers run on the Werkzeug server without debug mode or request logging
+SERVER_COMMANDS = {
+    "v2": (
+        BACKEND_DIR,
+        "import logging; from server import ChatServer; "
+        "server = ChatServer(port={port}); logging.disable(logging.INFO); "
+        "server.socketio.server.logger.disabled = True; "
+        "server.socketio.run(server.app, port={port}, allow_unsafe_werkzeug=True)",
+    ),
+    "asgi": (
+        BACKEND_DIR,
+        "import logging; from asgi import AsyncChatServer; "
+        "server = AsyncChatServer(port={port}); logging.disable(logging.INFO); "
+        "server.sio.logger.disabled = True; server.start()",
+    ),
+    "legacy": (
+        ROOT_DIR,
+        "import logging; from server import WhisperChat; "
+        "server = WhisperChat(port={port}); logging.disable(logging.INFO); "
+        "server.socketio.run(server.app, port={port}, allow_unsafe_werkzeug=True)",
+    ),
+}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(values):
+    """Latency summary in milliseconds"""
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else None,
+    }
+
+
+def make_image(size):
+    """Noise JPEG of roughly `size` bytes"""
+    side = max(16, int((size / 1.2) ** 0.5))
+    image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=95)
+    return output.getvalue()
+
+
+def http_session():
+    """HTTP session that keeps cookies for 127.0.0.1 (legacy server sessions)"""
+    return aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True))
+
+
+class RssSampler:
+    """Samples a process's resident set size from /proc"""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self.running = True
+        self.started = time.time()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _read_rss(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+
+    def _run(self):
+        while self.running:
+            rss = self._read_rss()
+            if rss is not None:
+                self.samples.append([round(time.time() - self.started, 2), rss])
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        return self.samples
+
+
+class ServerProcess:
+    """Runs a chat server in a subprocess for the benchmark"""
+
+    def __init__(
+        self, target, port, log_path=None, rate_limits=False, wire_format="json"
+    ):
+        cwd, command = SERVER_COMMANDS[target]
+        self.url = f"http://127.0.0.1:{port}"
+        self.log = open(log_path, "w") if log_path else subprocess.DEVNULL
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", command.format(port=port)],
+            cwd=cwd,
+            env={
+                **os.environ,
+                "RATE_LIMITING": "1" if rate_limits else "0",
+                "WIRE_FORMAT": wire_format,
+            },
+            stdout=self.log,
+            stderr=self.log,
+        )
+
+    async def wait_ready(self, timeout=15.0):
+        deadline = time.time() + timeout
+        async with http_session() as http:
+            while time.time() < deadline:
+                try:
+                    async with http.get(
+                        self.url + "/socket.io/?EIO=4&transport=polling"
+                    ):
+                        return
+                except aiohttp.ClientError:
+                    await asyncio.sleep(0.2)
+        raise RuntimeError("Server did not start in time")
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+        if self.log is not subprocess.DEVNULL:
+            self.log.close()
+
+
+class BenchClient:
+    """Simulated chat user"""
+
+    def __init__(self, bench, name):
+        self.bench = bench
+        self.name = name
+        serializer = "msgpack" if bench.args.wire_format == "msgpack" else "default"
+        self.sio = socketio.AsyncClient(reconnection=False, serializer=serializer)
+        self.http = None
+        self.history = asyncio.Event()
+        self.history_bytes = 0
+        self.last_seq = None
+        self.sio.on("message_history", self._on_history)
+        self.sio.on("resync", self._on_resync)
+        self.sio.on("new_message", self._on_message)
+        self.sio.on("new_messages", self._on_batch)
+        self.sio.on("message", self._on_legacy_message)
+
+    async def _on_history(self, data):
+        if data.get("delta") and self.history.is_set():
+            # Messages the server held back while this client lagged
+            for message in data["messages"]:
+                await self._on_message(message)
+            return
+        if self.bench.args.wire_format == "msgpack":
+            import msgpack
+
+            self.history_bytes = len(msgpack.packb(data))
+        else:
+            self.history_bytes = len(json.dumps(data))
+        self.history.set()
+
+    async def _on_message(self, data):
+        seq = data.get("seq")
+        if seq is not None and self.last_seq is not None and seq <= self.last_seq:
+            return  # already delivered in a history delta
+        self.last_seq = data.get("seq", self.last_seq)
+        self.bench.record_delivery(data.get("message"), data.get("username"))
+
+    async def _on_resync(self, data):
+        self.bench.resyncs += 1
+        await self.sio.emit("sync", {"last_seen_seq": self.last_seq})
+
+    async def _on_batch(self, data):
+        for message in data["messages"]:
+            await self._on_message(message)
+
+    async def _on_legacy_message(self, data):
+        self.bench.record_delivery(data.get("message"), data.get("name"))
+
+
+class Benchmark:
+    """Drives clients against one server target"""
+
+    def __init__(self, args, url):
+        self.args = args
+        self.url = url
+        self.legacy = args.target == "legacy"
+        self.sent = {}
+        self.latencies = []
+        self.deliveries = 0
+        self.errors = 0
+        self.resyncs = 0
+        self.image = make_image(args.image_size) if args.image_size else None
+
+    def record_delivery(self, text, username):
+        if not text or not text.startswith("bench:"):
+            return
+        sent_at = self.sent.get(text.split(" ", 1)[0])
+        if sent_at is not None:
+            self.latencies.append((time.perf_counter() - sent_at) * 1000)
+        self.deliveries += 1
+
+    async def create_room(self, http, username):
+        if self.legacy:
+            data = {"name": username, "create": "1"}
+            async with http.post(self.url + "/", data=data, allow_redirects=False):
+                pass
+            async with http.get(self.url + "/room") as response:
+                page = await response.text()
+            return page.split("Room Code: ", 1)[1].split("<", 1)[0].strip()
+
+        async with http.post(
+            self.url + "/api/rooms", json={"username": username}
+        ) as response:
+            return (await response.json())["room_code"]
+
+    async def connect(self, client, room_code):
+        """Connect and join, returns seconds until history arrived"""
+        client.http = http_session()
+        started = time.perf_counter()
+        if self.legacy:
+            data = {"name": client.name, "code": room_code, "join": "1"}
+            async with client.http.post(
+                self.url + "/", data=data, allow_redirects=False
+            ):
+                pass
+            async with client.http.get(self.url + "/room") as response:
+                client.history_bytes = len(await response.read())
+            cookies = client.http.cookie_jar.filter_cookies(URL(self.url))
+            cookie = "; ".join(f"{key}={value.value}" for key, value in cookies.items())
+            await client.sio.connect(self.url, headers={"Cookie": cookie})
+            return time.perf_counter() - started
+
+        await client.sio.connect(self.url)
+        await client.sio.emit("join", {"room_code": room_code, "username": client.name})
+        await asyncio.wait_for(client.history.wait(), timeout=30)
+        return time.perf_counter() - started
+
+    async def disconnect(self, client):
+        if not self.legacy and client.sio.connected:
+            await client.sio.emit("leave")
+        await client.sio.disconnect()
+        await client.http.close()
+
+    async def send(self, client, sequence, with_image):
+        token = f"bench:{client.name}:{sequence}"
+        self.sent[token] = time.perf_counter()
+        text = f"{token} {'x' * self.args.message_size}"
+
+        if self.legacy:
+            await client.sio.emit("message", {"data": text})
+            return
+
+        payload = {"message": text}
+        if with_image and self.args.inline_images:
+            if self.args.wire_format == "msgpack":
+                payload["image"] = self.image
+            else:
+                payload["image"] = base64.b64encode(self.image).decode()
+        elif with_image:
+            room_code = self.rooms[client.name]
+            async with client.http.post(
+                f"{self.url}/api/rooms/{room_code}/images",
+                data=self.image,
+                headers={"Content-Type": "image/jpeg"},
+            ) as response:
+                if response.status != 201:
+                    self.errors += 1
+                    return
+                upload = await response.json()
+            payload["image_id"] = upload["image_id"]
+            payload["thumbnail_id"] = upload["thumbnail_id"]
+        await client.sio.emit("send_message", payload)
+
+    async def run_load(self):
+        args = self.args
+        self.rooms = {}
+        clients = []
+        join_times = []
+
+        async with http_session() as http:
+            room_codes = [
+                await self.create_room(http, f"owner{index}")
+                for index in range(args.rooms)
+            ]
+
+        for index in range(args.clients):
+            client = BenchClient(self, f"user{index}")
+            room_code = room_codes[index % len(room_codes)]
+            self.rooms[client.name] = room_code
+            join_times.append(await self.connect(client, room_code) * 1000)
+            clients.append(client)
+
+        expected = sum(
+            args.messages * len([c for c in clients if self.rooms[c.name] == code]) ** 2
+            for code in room_codes
+        )
+
+        async def drive(client):
+            for sequence in range(args.messages):
+                with_image = self.image is not None and (
+                    random.random() < args.image_ratio
+                )
+                await self.send(client, sequence, with_image)
+                await asyncio.sleep(1.0 / args.rate)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(drive(client) for client in clients))
+        deadline = time.time() + args.drain_timeout
+        while self.deliveries < expected and time.time() < deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+
+        for client in clients:
+            await self.disconnect(client)
+
+        sent = args.clients * args.messages
+        return {
+            "sent": sent,
+            "expected_deliveries": expected,
+            "deliveries": self.deliveries,
+            "upload_errors": self.errors,
+            "resyncs": self.resyncs,
+            "duration_s": round(elapsed, 3),
+            "sent_per_s": round(sent / elapsed, 1),
+            "delivered_per_s": round(self.deliveries / elapsed, 1),
+            "latency_ms": summarize(self.latencies),
+            "join_ms": summarize(join_times),
+        }
+
+    async def run_history(self):
+        """Measure join time for a room preloaded with N messages"""
+        results = []
+        for size in self.args.history_sizes:
+            async with http_session() as http:
+                room_code = await self.create_room(http, "historian")
+
+            writer = BenchClient(self, f"writer{size}")
+            await self.connect(writer, room_code)
+            for sequence in range(size):
+                text = f"history:{sequence} {'x' * self.args.message_size}"
+                event = "message" if self.legacy else "send_message"
+                key = "data" if self.legacy else "message"
+                await writer.sio.emit(event, {key: text})
+            await asyncio.sleep(0.5 + size / 2000)
+
+            reader = BenchClient(self, f"reader{size}")
+            join_ms = await self.connect(reader, room_code) * 1000
+            results.append(
+                {
+                    "history_size": size,
+                    "join_ms": round(join_ms, 2),
+                    "history_bytes": reader.history_bytes,
+                }
+            )
+            await self.disconnect(reader)
+            await self.disconnect(writer)
+        return results
+
+
+def run_engine(args):
+    """Time engine calls directly, without Flask or Socket.IO"""
+    from engine import ChatEngine
+    from store import MemoryRoomStore
+
+    engine = ChatEngine(MemoryRoomStore(1000, 1024 * 1024))
+    rooms = [engine.create() for _ in range(args.rooms)]
+    for room_code in rooms:
+        engine.join(room_code)
+
+    text = "x" * args.message_size
+    latencies = []
+    started = time.perf_counter()
+    for sequence in range(args.clients * args.messages):
+        posted = time.perf_counter()
+        engine.post(rooms[sequence % len(rooms)], "bench", text)
+        latencies.append((time.perf_counter() - posted) * 1000)
+    elapsed = time.perf_counter() - started
+
+    history = []
+    for size in args.history_sizes:
+        room_code = engine.create()
+        for _ in range(size):
+            engine.post(room_code, "bench", text)
+        page_started = time.perf_counter()
+        engine.history(room_code)
+        page_ms = (time.perf_counter() - page_started) * 1000
+        since_started = time.perf_counter()
+        engine.history_since(room_code, max(0, size - 10))
+        since_ms = (time.perf_counter() - since_started) * 1000
+        history.append(
+            {
+                "history_size": size,
+                "page_ms": round(page_ms, 4),
+                "since_ms": round(since_ms, 4),
+            }
+        )
+
+    return {
+        "target": args.target,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "port", "server_log")
+        },
+        "load": {
+            "sent": len(latencies),
+            "duration_s": round(elapsed, 3),
+            "sent_per_s": round(len(latencies) / elapsed, 1),
+            "latency_ms": summarize(latencies),
+        },
+        "join_vs_history": history,
+    }
+
+
+async def run(args):
+    server = ServerProcess(
+        args.target,
+        args.port,
+        args.server_log,
+        rate_limits=args.rate_limits,
+        wire_format=args.wire_format,
+    )
+    try:
+        await server.wait_ready()
+        sampler = RssSampler(server.process.pid, args.rss_interval)
+        bench = Benchmark(args, server.url)
+        load = await bench.run_load()
+        history = await bench.run_history()
+        rss = sampler.stop()
+    finally:
+        server.stop()
+
+    return {
+        "target": args.target,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "port", "server_log")
+        },
+        "load": load,
+        "join_vs_history": history,
+        "rss": {
+            "peak_bytes": max((sample[1] for sample in rss), default=None),
+            "samples": rss,
+        },
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--target", choices=sorted([*SERVER_COMMANDS, "engine"]), default="v2"
+    )
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--rooms", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=20, help="per client")
+    parser.add_argument("--rate", type=float, default=10.0, help="msgs/s per client")
+    parser.add_argument("--message-size", type=int, default=64, help="bytes of text")
+    parser.add_argument("--image-size", type=int, default=0, help="bytes, 0 = none")
+    parser.add_argument("--image-ratio", type=float, default=0.1)
+    parser.add_argument("--inline-images", action="store_true")
+    parser.add_argument(
+        "--history-sizes",
+        type=lambda value: [int(size) for size in value.split(",") if size],
+        default=[0, 100, 1000],
+    )
+    parser.add_argument("--drain-timeout", type=float, default=10.0)
+    parser.add_argument("--rss-interval", type=float, default=0.5)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--server-log", help="write server output here")
+    parser.add_argument("--wire-format", choices=["json", "msgpack"], default="json")
+    parser.add_argument(
+        "--rate-limits", action="store_true", help="keep server rate limits enabled"
+    )
+    args = parser.parse_args(argv)
+    if args.target == "legacy" and args.image_size:
+        parser.error("the legacy server does not support images")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.target == "engine":
+        results = run_engine(args)
+    else:
+        results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
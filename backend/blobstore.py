@@ -0,0 +1,132 @@
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+
+from PIL import Image
+from io import BytesIO
+
+
+class BlobError(Exception):
+    """Raised when a blob cannot be stored"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class BlobStore:
+    """Content-addressed image store on local disk"""
+
+    BLOB_ID_PATTERN = re.compile(r"^[0-9a-f]{64}\.(jpeg|png|gif|webp)$")
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, root=None, max_size=None, allowed_formats=None):
+        self.temporary = not root
+        self.root = root or tempfile.mkdtemp(prefix="whisperchat-blobs-")
+        self.max_size = max_size
+        self.allowed_formats = allowed_formats or []
+        os.makedirs(self.root, exist_ok=True)
+
+    def is_valid_id(self, blob_id):
+        """Check blob id shape before touching the filesystem"""
+        return bool(blob_id) and bool(self.BLOB_ID_PATTERN.match(blob_id))
+
+    def path(self, blob_id):
+        """Absolute path for a blob id"""
+        return os.path.join(self.root, blob_id[:2], blob_id)
+
+    def exists(self, blob_id):
+        """Check if blob is stored"""
+        return self.is_valid_id(blob_id) and os.path.exists(self.path(blob_id))
+
+    def stage_stream(self, stream):
+        """Stream bytes to a temporary file while hashing and validate them
+
+        Returns (tmp_path, size, digest, image_format); the caller either
+        commits the file or removes it.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    chunk = stream.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if self.max_size and size > self.max_size:
+                        raise BlobError(
+                            f"Image size too large (max {self.max_size // (1024*1024)}MB)",
+                            413,
+                        )
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            if size == 0:
+                raise BlobError("Empty upload")
+
+            image_format = self._validate(tmp_path)
+            return tmp_path, size, digest.hexdigest(), image_format
+
+        except BaseException:
+            self.discard(tmp_path)
+            raise
+
+    def commit(self, tmp_path, digest, image_format):
+        """Move a staged file to its content address"""
+        blob_id = f"{digest}.{image_format.lower()}"
+        final_path = self.path(blob_id)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, final_path)
+        return blob_id
+
+    def discard(self, tmp_path):
+        """Remove a staged file if it is still there"""
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def put_stream(self, stream):
+        """Stream bytes to disk while hashing, validate and commit the blob"""
+        tmp_path, size, digest, image_format = self.stage_stream(stream)
+        return self.commit(tmp_path, digest, image_format), size
+
+    def put_bytes(self, data):
+        """Store an in-memory payload"""
+        return self.put_stream(BytesIO(data))
+
+    def _validate(self, file_path):
+        """Identify image format from the file header"""
+        try:
+            with Image.open(file_path) as image:
+                image_format = image.format
+        except Exception:
+            raise BlobError("Invalid image: unrecognized file format")
+
+        if image_format not in self.allowed_formats:
+            raise BlobError(
+                f"Unsupported image format: {image_format}. Allowed: {', '.join(self.allowed_formats)}"
+            )
+        return image_format
+
+    def close(self):
+        """Remove the storage directory if it was created for this process"""
+        if self.temporary:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def delete(self, blob_id):
+        """Remove a blob from disk"""
+        if not self.is_valid_id(blob_id):
+            return
+        try:
+            os.remove(self.path(blob_id))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,138 @@
+import time
+import secrets
+
+from history import Message, epoch_ms
+from roomcodes import RoomCodeAllocator
+from scheduler import CleanupScheduler
+
+
+class ChatEngine:
+    """Room and message engine shared by the chat front ends
+
+    Knows nothing about HTTP or Socket.IO: front ends turn requests into
+    these calls and deliver what they return. Rooms live in a RoomStore,
+    and a room left without members is deleted by the cleanup scheduler
+    once `cleanup_delay` has passed without anyone rejoining.
+    """
+
+    def __init__(
+        self,
+        store,
+        code_length=7,
+        cleanup_delay=120.0,
+        idle_timeout=600.0,
+        page_size=50,
+        sync_limit=200,
+        sweep_interval=1.0,
+        reconcile_interval=60.0,
+        accept_code=None,
+        on_expire=None,
+    ):
+        self.store = store
+        self.cleanup_delay = cleanup_delay
+        self.idle_timeout = idle_timeout
+        self.page_size = page_size
+        self.sync_limit = sync_limit
+        self.accept_code = accept_code
+        self.on_expire = on_expire
+        self.room_codes = RoomCodeAllocator(code_length)
+        self.scheduler = CleanupScheduler(
+            self.expire,
+            interval=sweep_interval,
+            reconcile=store.due_rooms,
+            reconcile_interval=reconcile_interval,
+        )
+
+    def create(self):
+        """Create a room and return its code
+
+        The allocator never repeats a code locally; the store check only
+        matters for codes taken by other processes sharing the store.
+        Codes rejected by `accept_code` are skipped. A room nobody joins
+        expires after `idle_timeout`.
+        """
+        while True:
+            room_code = self.room_codes.allocate()
+            if self.accept_code and not self.accept_code(room_code):
+                continue
+            if self.store.create_room(room_code):
+                self.schedule_cleanup(room_code, self.idle_timeout)
+                return room_code
+
+    def exists(self, room_code):
+        """Check if a room exists"""
+        return self.store.room_exists(room_code)
+
+    def join(self, room_code):
+        """Add a member, returns the member count or None if room is gone"""
+        self.cancel_cleanup(room_code)
+        return self.store.add_member(room_code)
+
+    def leave(self, room_code):
+        """Remove a member, returns the member count or None if room is gone
+
+        The last member leaving schedules the room for cleanup instead of
+        deleting it, so a reload or reconnect finds the room again.
+        """
+        members = self.store.remove_member(room_code)
+        if members is not None and members <= 0:
+            self.schedule_cleanup(room_code)
+        return members
+
+    def post(self, room_code, username, text, image_id=None, thumbnail_id=None):
+        """Store a chat message, returns it or None if room is gone"""
+        message = Message(
+            secrets.token_hex(8),
+            username,
+            text,
+            epoch_ms(),
+            image_id=image_id,
+            thumbnail_id=thumbnail_id,
+        )
+        if self.store.append_message(room_code, message) is None:
+            return None
+        return message
+
+    def history(self, room_code, before=None, limit=None):
+        """Return (messages, cursor) for a page of at most `page_size`"""
+        limit = max(1, min(limit or self.page_size, self.page_size))
+        return self.store.history_page(room_code, before, limit)
+
+    def history_since(self, room_code, last_seen_seq):
+        """Messages after sequence `last_seen_seq`, or None for a full resend"""
+        if not isinstance(last_seen_seq, int) or isinstance(last_seen_seq, bool):
+            return None
+        return self.store.history_since(room_code, last_seen_seq, self.sync_limit)
+
+    def schedule_cleanup(self, room_code, delay=None):
+        """Delete room after `delay` seconds unless somebody joins"""
+        deadline = time.time() + (delay or self.cleanup_delay)
+        self.store.schedule_cleanup(room_code, deadline)
+        self.scheduler.schedule(room_code, deadline)
+
+    def cancel_cleanup(self, room_code):
+        """Cancel a pending cleanup, returns True if one was pending"""
+        self.scheduler.cancel(room_code)
+        return self.store.cancel_cleanup(room_code)
+
+    def expire(self, room_code):
+        """Delete a room whose cleanup deadline has passed
+
+        Returns the image blob ids no longer referenced by any room, or
+        None when the room was not deleted. `on_expire` gets the same.
+        """
+        orphans = self.store.expire_room(room_code, time.time())
+        if orphans is not None and self.on_expire:
+            self.on_expire(room_code, orphans)
+        return orphans
+
+    def restore(self, state):
+        """Load rooms from a store snapshot, returns the number restored
+
+        Members have to reconnect, so every restored room is scheduled
+        for cleanup like an empty one.
+        """
+        deadlines = self.store.restore(state, time.time() + self.cleanup_delay)
+        for room_code, deadline in deadlines.items():
+            self.scheduler.schedule(room_code, deadline)
+        return len(deadlines)
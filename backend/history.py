@@ -0,0 +1,170 @@
+import time
+
+from collections import deque
+from datetime import datetime
+from itertools import islice
+
+
+def epoch_ms():
+    """Current time as integer epoch milliseconds"""
+    return int(time.time() * 1000)
+
+
+def format_timestamp(timestamp, epoch=False):
+    """Render an epoch-millisecond timestamp for a socket payload
+
+    Binary clients get the integer as is, JSON clients a local ISO string.
+    """
+    if epoch:
+        return timestamp
+    return datetime.fromtimestamp(timestamp / 1000).isoformat()
+
+
+class Message:
+    """Compact chat message record"""
+
+    __slots__ = (
+        "index",
+        "id",
+        "username",
+        "message",
+        "timestamp",
+        "image_id",
+        "thumbnail_id",
+    )
+
+    # Rough per-record overhead used for the history byte budget
+    OVERHEAD = 160
+
+    def __init__(
+        self, id, username, message, timestamp, image_id=None, thumbnail_id=None
+    ):
+        self.index = None
+        self.id = id
+        self.username = username
+        self.message = message
+        self.timestamp = timestamp
+        self.image_id = image_id
+        self.thumbnail_id = thumbnail_id
+
+    @property
+    def size(self):
+        """Approximate memory footprint in bytes"""
+        return (
+            self.OVERHEAD
+            + len(self.username or "")
+            + len(self.message or "")
+            + len(self.image_id or "")
+            + len(self.thumbnail_id or "")
+        )
+
+    def to_record(self):
+        """Pack message into a tuple for external storage"""
+        return (
+            self.id,
+            self.username,
+            self.message,
+            self.timestamp,
+            self.image_id,
+            self.thumbnail_id,
+        )
+
+    @classmethod
+    def from_record(cls, record, index=None):
+        """Rebuild a message from a stored tuple"""
+        message = cls(*record)
+        message.index = index
+        return message
+
+    def to_dict(self, epoch=False):
+        """Serialize message for socket payloads"""
+        data = {
+            "id": self.id,
+            "seq": self.index,
+            "username": self.username,
+            "message": self.message,
+            "timestamp": format_timestamp(self.timestamp, epoch),
+        }
+        if self.image_id:
+            data["image_id"] = self.image_id
+            data["thumbnail_id"] = self.thumbnail_id
+            data["type"] = "image"
+        return data
+
+
+class MessageHistory:
+    """Bounded per-room message ring buffer with cursor pagination"""
+
+    def __init__(self, max_messages, max_bytes):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.messages = deque()
+        self.next_index = 0
+        self.total_bytes = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    @property
+    def first_index(self):
+        """Index of the oldest retained message"""
+        return self.messages[0].index if self.messages else self.next_index
+
+    def append(self, message):
+        """Add a message, evicting the oldest ones beyond the caps"""
+        message.index = self.next_index
+        self.next_index += 1
+        self.messages.append(message)
+        self.total_bytes += message.size
+
+        while len(self.messages) > 1 and (
+            len(self.messages) > self.max_messages or self.total_bytes > self.max_bytes
+        ):
+            oldest = self.messages[0]
+            if not self._evict(oldest):
+                # Kept over the caps until a later append evicts it
+                break
+            self.messages.popleft()
+            self.total_bytes -= oldest.size
+
+        return message
+
+    def load(self, messages, next_index):
+        """Refill an empty history with messages that keep their indexes"""
+        if messages:
+            self.next_index = messages[0].index
+        for message in messages:
+            self.append(message)
+        self.next_index = next_index
+
+    def _evict(self, message):
+        """Called with each message about to leave the buffer
+
+        Returning False keeps the message in the buffer for now.
+        """
+        return True
+
+    def close(self):
+        """Release resources held by the history"""
+
+    def page(self, before=None, limit=50):
+        """Return up to `limit` messages older than cursor `before`
+
+        Returns the messages oldest first and the cursor for the next
+        older page, or None when the start of the history is reached.
+        """
+        end = len(self.messages)
+        if before is not None:
+            end = max(0, min(end, before - self.first_index))
+
+        start = max(0, end - limit)
+        total = len(self.messages)
+        if end <= total // 2:
+            messages = list(islice(self.messages, start, end))
+        else:
+            # Pages near the tail are cheaper to walk from the right
+            messages = list(islice(reversed(self.messages), total - end, total - start))
+            messages.reverse()
+
+        cursor = messages[0].index if messages and start > 0 else None
+        return messages, cursor
@@ -0,0 +1,76 @@
+import threading
+
+from collections import OrderedDict
+
+
+class ImageCache:
+    """Size-bounded LRU of image blobs shared by every room
+
+    Blob ids are content hashes, so an image posted many times or in
+    many rooms is held once. Source digests map to the blobs they were
+    transcoded into, which lets a repeated send skip the image pipeline.
+    Rooms count their references in the room store; once the last one
+    is gone the blob is released here as well.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.blobs = OrderedDict()
+        self.size = 0
+        self.sources = {}
+        self.digests = {}
+        self.lock = threading.Lock()
+
+    def get(self, blob_id):
+        """Cached bytes of a blob, or None"""
+        with self.lock:
+            data = self.blobs.get(blob_id)
+            if data is not None:
+                self.blobs.move_to_end(blob_id)
+            return data
+
+    def fits(self, size):
+        """Check if a blob of `size` bytes would be cached
+
+        Blobs larger than a quarter of the budget are not, so one large
+        image cannot flush everything else.
+        """
+        return size <= self.max_bytes // 4
+
+    def put(self, blob_id, data):
+        """Cache the bytes of a blob, evicting the least recently used ones"""
+        if not self.fits(len(data)):
+            return
+        with self.lock:
+            if blob_id in self.blobs:
+                return
+            self.blobs[blob_id] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.blobs.popitem(last=False)
+                self.size -= len(evicted)
+
+    def lookup(self, digest):
+        """Blob ids a source image was transcoded into, or None"""
+        return self.sources.get(digest)
+
+    def remember(self, digest, blob_ids):
+        """Record the blobs produced for a source image digest"""
+        with self.lock:
+            self.sources[digest] = blob_ids
+            for blob_id in blob_ids:
+                self.digests.setdefault(blob_id, set()).add(digest)
+
+    def remembered(self, blob_id):
+        """Check if a blob was recorded for any source image digest"""
+        with self.lock:
+            return blob_id in self.digests
+
+    def release(self, blob_id):
+        """Forget a blob that is no longer referenced by any room"""
+        with self.lock:
+            data = self.blobs.pop(blob_id, None)
+            if data is not None:
+                self.size -= len(data)
+            for digest in self.digests.pop(blob_id, ()):
+                self.sources.pop(digest, None)
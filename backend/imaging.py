@@ -0,0 +1,195 @@
+import time
+import logging
+import threading
+import multiprocessing
+
+from PIL import Image, ImageOps, ImageSequence
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from blobstore import BlobError
+
+
+def transcode_image(blobs, tmp_path, max_dimension, thumbnail_size, quality):
+    """Strip metadata, downscale and re-encode a staged image to WEBP
+
+    Runs in a worker process. Returns (image_id, thumbnail_id, timings).
+    Animated images are re-encoded frame by frame at their original size.
+    """
+    timings = {"started": time.monotonic()}
+
+    stage_start = time.perf_counter()
+    with Image.open(tmp_path) as source:
+        animated = getattr(source, "is_animated", False)
+        source.load()
+        image = ImageOps.exif_transpose(source)
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.mode or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    timings["decode"] = time.perf_counter() - stage_start
+
+    if animated:
+        stage_start = time.perf_counter()
+        with Image.open(tmp_path) as source:
+            image_id, _ = blobs.put_bytes(encode_animation(source, quality))
+        timings["encode"] = time.perf_counter() - stage_start
+    else:
+        stage_start = time.perf_counter()
+        if max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        timings["resize"] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        output = BytesIO()
+        image.save(output, "WEBP", quality=quality)
+        image_id, _ = blobs.put_bytes(output.getvalue())
+        timings["encode"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    image.thumbnail((thumbnail_size, thumbnail_size))
+    output = BytesIO()
+    image.save(output, "WEBP", quality=quality)
+    thumbnail_id, _ = blobs.put_bytes(output.getvalue())
+    timings["thumbnail"] = time.perf_counter() - stage_start
+
+    return image_id, thumbnail_id, timings
+
+
+def encode_animation(source, quality):
+    """Re-encode all frames of an animated image to WEBP, without metadata"""
+    durations = []
+    for frame in ImageSequence.Iterator(source):
+        frame.load()
+        durations.append(frame.info.get("duration", 100))
+    source.seek(0)
+    output = BytesIO()
+    source.save(
+        output,
+        "WEBP",
+        save_all=True,
+        duration=durations,
+        loop=source.info.get("loop", 0),
+        quality=quality,
+    )
+    return output.getvalue()
+
+
+class ImagePipeline:
+    """Bounded process pool that validates and transcodes uploaded images
+
+    With a `cache`, an image whose source bytes were transcoded before
+    reuses the stored blobs without entering the pool.
+    """
+
+    def __init__(
+        self,
+        blobs,
+        workers=4,
+        queue_size=16,
+        max_dimension=2048,
+        thumbnail_size=320,
+        quality=85,
+        timeout=30.0,
+        cache=None,
+    ):
+        self.blobs = blobs
+        self.cache = cache
+        self.max_dimension = max_dimension
+        self.thumbnail_size = thumbnail_size
+        self.quality = quality
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.lock = threading.Lock()
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self.logger = logging.getLogger(__name__)
+
+    def process_stream(self, stream):
+        """Stage an upload stream and run it through the pipeline"""
+        return self.process(*self.blobs.stage_stream(stream))
+
+    def process_bytes(self, data):
+        """Stage an in-memory payload and run it through the pipeline"""
+        return self.process_stream(BytesIO(data))
+
+    def process(self, tmp_path, size, digest, image_format):
+        """Transcode a staged image
+
+        Returns (image_id, thumbnail_id, timings), raises BlobError when
+        the pipeline is saturated or the image cannot be decoded.
+        """
+        if self.cache:
+            started = time.perf_counter()
+            blob_ids = self.cache.lookup(digest)
+            if blob_ids and all(self.blobs.exists(b) for b in blob_ids):
+                self.blobs.discard(tmp_path)
+                return (*blob_ids, {"cached": time.perf_counter() - started})
+
+        if not self.slots.acquire(blocking=False):
+            self.blobs.discard(tmp_path)
+            raise BlobError("Server is busy processing images, try again", 503)
+
+        submitted = time.monotonic()
+        running = False
+        try:
+            future = self.executor.submit(
+                transcode_image,
+                self.blobs,
+                tmp_path,
+                self.max_dimension,
+                self.thumbnail_size,
+                self.quality,
+            )
+            image_id, thumbnail_id, timings = future.result(timeout=self.timeout)
+
+        except FutureTimeoutError:
+            # Only a queued transcode can be cancelled; a running one keeps
+            # its slot and staged file until the worker is done with them
+            running = not future.cancel()
+            if running:
+                future.add_done_callback(lambda done: self._finish_late(done, tmp_path))
+            raise BlobError("Image processing timed out", 503)
+        except BlobError:
+            raise
+        except Exception as e:
+            self.logger.warning(f"Image processing failed: {e}")
+            raise BlobError("Invalid image: could not be decoded")
+        finally:
+            if not running:
+                self._release(tmp_path)
+
+        if self.cache:
+            with self.lock:
+                self.cache.remember(digest, (image_id, thumbnail_id))
+            if not (self.blobs.exists(image_id) and self.blobs.exists(thumbnail_id)):
+                # A timed out transcode of the same image removed them
+                raise BlobError("Image processing was interrupted, try again", 503)
+        timings["queue"] = timings.pop("started") - submitted
+        timings["total"] = time.monotonic() - submitted
+        return image_id, thumbnail_id, timings
+
+    def _release(self, tmp_path):
+        """Free the pipeline slot of an image and its staged file"""
+        self.slots.release()
+        self.blobs.discard(tmp_path)
+
+    def _finish_late(self, future, tmp_path):
+        """Release a timed out transcode once its worker is done
+
+        Nobody was handed the blobs it wrote, so they are deleted unless
+        an upload that finished in time produced the same ones. Without a
+        cache there is no record of those, and the blobs are kept.
+        """
+        self._release(tmp_path)
+        if self.cache is None or future.exception() is not None:
+            return
+        image_id, thumbnail_id, _ = future.result()
+        with self.lock:
+            for blob_id in (image_id, thumbnail_id):
+                if not self.cache.remembered(blob_id):
+                    self.blobs.delete(blob_id)
+
+    def shutdown(self):
+        """Stop worker processes"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
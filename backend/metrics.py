@@ -0,0 +1,175 @@
+import bisect
+import threading
+
+
+def payload_size(value):
+    """Approximate encoded size of a socket payload in bytes"""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(key) + payload_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(item) for item in value)
+    return 8
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    """Base class for labelled metrics"""
+
+    TYPE = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _header(self):
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.TYPE}",
+        ]
+
+
+class Counter(Metric):
+    """Monotonically increasing value"""
+
+    TYPE = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self.values.get(labels, 0)
+
+    def render(self):
+        lines = self._header()
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            lines.append(
+                f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+            )
+        return lines
+
+
+class Gauge(Metric):
+    """Value sampled from a callback at scrape time"""
+
+    TYPE = "gauge"
+
+    def __init__(self, name, help_text, callback):
+        super().__init__(name, help_text)
+        self.callback = callback
+
+    def render(self):
+        return self._header() + [f"{self.name} {self.callback()}"]
+
+
+class Histogram(Metric):
+    """Bucketed distribution of observed values"""
+
+    TYPE = "histogram"
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * len(self.buckets), 0, 0]
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self._header()
+        with self.lock:
+            items = sorted(self.values.items())
+            items = [(labels, (list(b), s, c)) for labels, (b, s, c) in items]
+
+        for labels, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                label_text = _format_labels(self.label_names, labels, ("le", bound))
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _format_labels(self.label_names, labels, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{label_text} {count}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class SampledHistogram(Histogram):
+    """Histogram rebuilt from a callback's values at scrape time"""
+
+    def __init__(self, name, help_text, buckets, callback):
+        super().__init__(name, help_text, buckets)
+        self.callback = callback
+
+    def render(self):
+        self.values = {}
+        for value in self.callback():
+            self.observe(value)
+        return super().render()
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text format"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    SIZE_BUCKETS = tuple(256 * 4**power for power in range(10))  # 256B .. 64MB
+    FANOUT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+    def __init__(self, prefix="whisperchat"):
+        self.prefix = prefix
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(f"{self.prefix}_{name}", help_text, labels))
+
+    def gauge(self, name, help_text, callback):
+        return self._add(Gauge(f"{self.prefix}_{name}", help_text, callback))
+
+    def histogram(self, name, help_text, buckets, labels=()):
+        return self._add(Histogram(f"{self.prefix}_{name}", help_text, buckets, labels))
+
+    def sampled_histogram(self, name, help_text, buckets, callback):
+        return self._add(
+            SampledHistogram(f"{self.prefix}_{name}", help_text, buckets, callback)
+        )
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for metric in self.metrics:
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,55 @@
+import time
+import logging
+import threading
+
+
+class PresenceThrottle:
+    """Per-room throttle for presence snapshots
+
+    Joins, leaves and typing changes only mark a room; a single loop sends
+    one snapshot per marked room every `interval` seconds, so a room costs
+    at most one presence frame per interval however busy it is.
+    """
+
+    def __init__(self, flush, interval=1.0):
+        self.flush = flush
+        self.interval = interval
+        self.due = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def pending(self):
+        """Number of rooms waiting for a snapshot"""
+        return len(self.due)
+
+    def mark(self, room, at=None):
+        """Request a snapshot for `room` no later than `at` (default now)"""
+        at = time.time() if at is None else at
+        with self.lock:
+            if at < self.due.get(room, float("inf")):
+                self.due[room] = at
+
+    def pop_due(self, now):
+        """Remove and return rooms whose snapshot is due"""
+        with self.lock:
+            rooms = [room for room, at in self.due.items() if at <= now]
+            for room in rooms:
+                del self.due[room]
+        return rooms
+
+    def run(self, sleep=time.sleep):
+        """Flush loop, meant to run as a background task"""
+        self.running = True
+        while self.running:
+            for room in self.pop_due(time.time()):
+                try:
+                    self.flush(room)
+                except Exception:
+                    self.logger.exception(f"Presence update for {room} failed")
+            sleep(self.interval)
+
+    def stop(self):
+        """Stop the flush loop after the current pass"""
+        self.running = False
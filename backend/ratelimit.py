@@ -0,0 +1,57 @@
+import time
+import threading
+
+
+class RateLimiter:
+    """Token buckets keyed by client, socket id or room
+
+    Each key holds only [tokens, last refill]; buckets refill lazily on
+    the next check. Full buckets carry no information, so they are
+    pruned once the table grows past `max_keys`; if most buckets are
+    still in use the threshold doubles, keeping pruning amortized O(1).
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.prune_at = max_keys
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def allow(self, key, cost=1):
+        """Take `cost` tokens from a bucket, returns False when it runs dry
+
+        Costs larger than the burst are capped so a single large request
+        can still pass against a full bucket.
+        """
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= self.prune_at:
+                    self._prune(now)
+                bucket = self.buckets[key] = [self.burst, now]
+            else:
+                tokens = bucket[0] + (now - bucket[1]) * self.rate
+                bucket[0] = min(self.burst, tokens)
+                bucket[1] = now
+
+            if bucket[0] < cost:
+                return False
+            bucket[0] -= cost
+            return True
+
+    def forget(self, key):
+        """Drop the bucket for a key"""
+        with self.lock:
+            self.buckets.pop(key, None)
+
+    def _prune(self, now):
+        self.buckets = {
+            key: bucket
+            for key, bucket in self.buckets.items()
+            if bucket[0] + (now - bucket[1]) * self.rate < self.burst
+        }
+        self.prune_at = max(self.max_keys, 2 * len(self.buckets))
@@ -0,0 +1,69 @@
+import hashlib
+import secrets
+import threading
+
+from string import ascii_uppercase
+
+
+class RoomCodeAllocator:
+    """Hands out unique room codes in O(1)
+
+    Codes come from a counter passed through a keyed Feistel permutation
+    of the code space, so consecutive codes look random without a secret
+    key, and no code repeats until every code of the configured length
+    has been handed out. Recently freed codes therefore never come back
+    soon after their room is deleted.
+    """
+
+    ROUNDS = 4
+
+    def __init__(self, length, alphabet=ascii_uppercase):
+        self.length = length
+        self.alphabet = alphabet
+        self.capacity = len(alphabet) ** length
+        self.half_bits = ((self.capacity - 1).bit_length() + 1) // 2
+        self.mask = (1 << self.half_bits) - 1
+        self.key = secrets.token_bytes(32)
+        self.counter = secrets.randbelow(self.capacity)
+        self.lock = threading.Lock()
+
+    def headroom(self, active):
+        """Codes left for new rooms while `active` rooms exist"""
+        return self.capacity - active
+
+    def allocate(self):
+        """Return the next code"""
+        with self.lock:
+            value = self.counter
+            self.counter = (self.counter + 1) % self.capacity
+        return self._encode(self._permute(value))
+
+    def _permute(self, value):
+        # Cycle-walk until the block permutation lands inside the code space;
+        # the block is less than four times larger, so this takes few steps
+        while True:
+            value = self._feistel(value)
+            if value < self.capacity:
+                return value
+
+    def _feistel(self, value):
+        left, right = value >> self.half_bits, value & self.mask
+        for round_number in range(self.ROUNDS):
+            left, right = right, left ^ self._round(round_number, right)
+        return (left << self.half_bits) | right
+
+    def _round(self, round_number, value):
+        digest = hashlib.blake2b(
+            bytes([round_number]) + value.to_bytes(8, "big"),
+            key=self.key,
+            digest_size=8,
+        ).digest()
+        return int.from_bytes(digest, "big") & self.mask
+
+    def _encode(self, value):
+        base = len(self.alphabet)
+        chars = []
+        for _ in range(self.length):
+            value, digit = divmod(value, base)
+            chars.append(self.alphabet[digit])
+        return "".join(chars)
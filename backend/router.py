@@ -0,0 +1,177 @@
+"""Room-sharded entry point for the chat server
+
+Starts SHARD_WORKERS chat workers on local ports and proxies every
+request to the worker owning its room, so each room lives in a single
+process and broadcasts never need a message queue:
+
+    python router.py
+
+Requests name their room in the /api/rooms/<room_code> path or in a
+`room` query parameter, which the web client adds to its Socket.IO
+connection and image URLs. Anything else goes to the workers in turn.
+"""
+
+import os
+import re
+import signal
+import asyncio
+import logging
+import itertools
+import multiprocessing
+
+from urllib.parse import parse_qs
+from sharding import HashRing
+from server import Config
+
+
+class ShardRouter:
+    """HTTP and WebSocket proxy routing on the room code
+
+    Only the request head is parsed; everything after it, including
+    upgraded WebSocket traffic, is piped through as raw bytes. Plain
+    requests are sent with `Connection: close` so a kept-alive client
+    connection never carries requests for another room to the same
+    worker.
+    """
+
+    ROOM_PATH = re.compile(r"^/api/rooms/([^/]+)")
+    MAX_HEAD_SIZE = 64 * 1024  # in bytes
+    CHUNK_SIZE = 64 * 1024  # in bytes
+    BAD_GATEWAY = (
+        b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+    )
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.ring = HashRing(range(len(workers)))
+        self.next_worker = itertools.cycle(range(len(workers)))
+        self.logger = logging.getLogger(__name__)
+
+    def route(self, target):
+        """Index of the worker for a request target"""
+        path, _, query = target.partition("?")
+        match = self.ROOM_PATH.match(path)
+        room_code = match.group(1) if match else None
+        if room_code is None:
+            room_code = parse_qs(query).get("room", [None])[0]
+        if room_code:
+            return self.ring.node_for(room_code)
+        return next(self.next_worker)
+
+    def _rewrite_head(self, head, peer):
+        """Set forwarding headers, and close plain requests after one response"""
+        lines = head[:-4].split(b"\r\n")
+        fields = [(line.partition(b":")[0].strip().lower(), line) for line in lines[1:]]
+        upgrade = any(
+            b"upgrade" in line.partition(b":")[2].lower()
+            for name, line in fields
+            if name == b"connection"
+        )
+        headers = [
+            line
+            for name, line in fields
+            if name != b"x-forwarded-for" and (upgrade or name != b"connection")
+        ]
+        if not upgrade:
+            headers.append(b"Connection: close")
+        headers.append(b"X-Forwarded-For: " + peer.encode())
+        return b"\r\n".join([lines[0], *headers]) + b"\r\n\r\n"
+
+    async def handle(self, reader, writer):
+        """Proxy one client connection to its worker"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+            target = request_line.split(" ")[1]
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, IndexError):
+            writer.close()
+            return
+
+        host, port = self.workers[self.route(target)]
+        try:
+            worker_reader, worker_writer = await asyncio.open_connection(host, port)
+        except OSError:
+            self.logger.warning(f"Worker at {host}:{port} is unavailable")
+            writer.write(self.BAD_GATEWAY)
+            await writer.drain()
+            writer.close()
+            return
+
+        peer = writer.get_extra_info("peername")[0]
+        worker_writer.write(self._rewrite_head(head, peer))
+        await asyncio.gather(
+            self._pipe(reader, worker_writer), self._pipe(worker_reader, writer)
+        )
+
+    async def _pipe(self, reader, writer):
+        try:
+            while data := await reader.read(self.CHUNK_SIZE):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        """Accept connections until SIGINT or SIGTERM"""
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopped.set)
+
+        server = await asyncio.start_server(
+            self.handle, host, port, limit=self.MAX_HEAD_SIZE
+        )
+        async with server:
+            await stopped.wait()
+
+
+def run_worker(index, count, port):
+    """Run one shard of the chat server on a local port"""
+    from asgi import AsyncChatServer
+
+    Config.SHARD = (index, count)
+    if Config.SNAPSHOT_PATH:
+        Config.SNAPSHOT_PATH = f"{Config.SNAPSHOT_PATH}.{index}"
+    # Workers must not clean up or delete each other's files
+    if Config.HISTORY_SPILL_DIR:
+        Config.HISTORY_SPILL_DIR = os.path.join(
+            Config.HISTORY_SPILL_DIR, f"shard-{index}"
+        )
+    if Config.BLOB_STORAGE_DIR:
+        Config.BLOB_STORAGE_DIR = os.path.join(
+            Config.BLOB_STORAGE_DIR, f"shard-{index}"
+        )
+
+    AsyncChatServer(host="127.0.0.1", port=port).start()
+
+
+def main():
+    """Start the workers and route to them until stopped"""
+    logging.basicConfig(level=logging.INFO, format="%(levelname).1s: %(message)s")
+    count = max(1, Config.SHARD_WORKERS)
+    workers = [("127.0.0.1", Config.SHARD_PORT_BASE + index) for index in range(count)]
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(index, count, port))
+        for index, (_, port) in enumerate(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    print(
+        f"{Config.Colors.GREEN}Routing {Config.Colors.AQUA}http://{Config.HOST}:{Config.PORT}"
+        f"{Config.Colors.GREEN} to {count} workers{Config.Colors.RESET}"
+    )
+    try:
+        asyncio.run(ShardRouter(workers).serve(Config.HOST, Config.PORT))
+    finally:
+        # Workers drain on SIGTERM and save their rooms before exiting
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import time
+import heapq
+import logging
+import threading
+
+
+class CleanupScheduler:
+    """Single background sweeper for timed room cleanup
+
+    Deadlines live in a min-heap. Cancelling only drops the key from the
+    deadline map; stale heap entries are skipped when they surface.
+    """
+
+    def __init__(self, callback, interval=1.0, reconcile=None, reconcile_interval=60.0):
+        self.callback = callback
+        self.interval = interval
+        self.reconcile = reconcile
+        self.reconcile_interval = reconcile_interval
+        self.heap = []
+        self.deadlines = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def pending(self):
+        """Number of scheduled expiries"""
+        return len(self.deadlines)
+
+    def schedule(self, key, deadline):
+        """Schedule `key` to expire at `deadline`, replacing any earlier one"""
+        with self.lock:
+            self.deadlines[key] = deadline
+            heapq.heappush(self.heap, (deadline, key))
+
+    def cancel(self, key):
+        """Cancel a scheduled expiry, returns True if one was pending"""
+        with self.lock:
+            return self.deadlines.pop(key, None) is not None
+
+    def pop_due(self, now):
+        """Remove and return keys whose deadline has passed"""
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                deadline, key = heapq.heappop(self.heap)
+                if self.deadlines.get(key) == deadline:
+                    del self.deadlines[key]
+                    due.append(key)
+
+            # Drop stale entries once they dominate the heap
+            if len(self.heap) > 2 * len(self.deadlines) + 64:
+                self.heap = [(d, k) for k, d in self.deadlines.items()]
+                heapq.heapify(self.heap)
+        return due
+
+    def run(self, sleep=time.sleep):
+        """Sweep loop, meant to run as a background task"""
+        self.running = True
+        next_reconcile = time.time() + self.reconcile_interval
+        while self.running:
+            now = time.time()
+            keys = self.pop_due(now)
+            if self.reconcile and now >= next_reconcile:
+                local = set(keys)
+                keys.extend(key for key in self.reconcile(now) if key not in local)
+                next_reconcile = now + self.reconcile_interval
+
+            for key in keys:
+                try:
+                    self.callback(key)
+                except Exception:
+                    self.logger.exception(f"Cleanup of {key} failed")
+            sleep(self.interval)
+
+    def stop(self):
+        """Stop the sweep loop after the current pass"""
+        self.running = False
@@ -1,18 +1,32 @@
 import os
+import json
 import secrets
 import logging
-import random
+import signal
+import time
 import base64
-import threading
+import ipaddress
 
-from flask import Flask, request, abort, jsonify
+from io import BytesIO
+from flask import Flask, request, abort, jsonify, send_file, g
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask_socketio import SocketIO, join_room, leave_room
 from logging.config import dictConfig
-from string import ascii_uppercase
-from PIL import Image
-from io import BytesIO
 from datetime import datetime
+from blobstore import BlobStore, BlobError
+from history import epoch_ms, format_timestamp
+from store import MemoryRoomStore, RedisRoomStore
+from engine import ChatEngine
+from imaging import ImagePipeline
+from imagecache import ImageCache
+from metrics import MetricsRegistry, payload_size
+from batching import BroadcastBatcher
+from ratelimit import RateLimiter
+from presence import PresenceThrottle
+from assets import StaticAssets
+from sharding import HashRing
+from profiling import SamplingProfiler
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 
 # ===================================================== #
@@ -28,6 +42,16 @@ class Config:
     ###  Server Settings  ###
     HOST = os.getenv("HOST", "0.0.0.0")
     PORT = int(os.getenv("PORT", 8080))
+    HTTP_WORKERS = 16  # threads serving the REST routes in asyncio mode
+
+    ###  Frontend Settings  ###
+    ## Serve the web client from this directory; set to None for an API-only server
+    FRONTEND_DIR = os.getenv(
+        "FRONTEND_DIR",
+        os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontend"
+        ),
+    )
 
     ###  CORS Settings  ###
     ## Allow all origins; modify as needed
@@ -37,10 +61,96 @@ class Config:
     ###  Room Settings  ###
     ROOM_CODE_LENGTH = 7
     ROOM_CLEANUP_DELAY = 120.0  # in seconds
+    ROOM_IDLE_TIMEOUT = 600.0  # in seconds, for rooms nobody has joined yet
+    CLEANUP_SWEEP_INTERVAL = 1.0  # in seconds
+    CLEANUP_RECONCILE_INTERVAL = 60.0  # in seconds, catches shared-store expiries
+
+    ###  History Settings  ###
+    HISTORY_MAX_MESSAGES = 1000
+    HISTORY_MAX_BYTES = 1024 * 1024  # 1MB of message text per room
+    HISTORY_PAGE_SIZE = 50
+    HISTORY_SYNC_LIMIT = 200  # missed messages replayed on rejoin
+    ## Keep only recent messages in memory and spill older ones to encrypted
+    ## files in this directory (requires the cryptography package)
+    HISTORY_SPILL_DIR = os.getenv("HISTORY_SPILL_DIR")
+    HISTORY_HOT_MESSAGES = 100  # per room kept in memory when spilling
+
+    ###  Broadcast Settings  ###
+    ## Coalesce chat messages per room into `new_messages` batches under bursts
+    MESSAGE_BATCH_WINDOW = 0.0  # in seconds, 0 sends every message immediately
+    MESSAGE_BATCH_MAX = 50  # messages per batch before it is sent early
+
+    ###  Backpressure Settings  ###
+    ## Connections with this many undelivered packets stop receiving chat
+    ## messages and are asked to resync from history once they catch up;
+    ## below the low-water mark they are sent what they missed and resume
+    OUTBOUND_HIGH_WATER = 256  # queued packets per connection, None disables
+    OUTBOUND_LOW_WATER = 32  # queued packets per connection
+
+    ###  Presence Settings  ###
+    PRESENCE_INTERVAL = 1.0  # in seconds, at most one presence snapshot per room
+    TYPING_TIMEOUT = 5.0  # in seconds without a typing event before it clears
+
+    ###  Wire Format Settings  ###
+    ## "json", or "msgpack" for binary frames with epoch-millisecond timestamps
+    ## and raw image bytes (requires the msgpack package)
+    WIRE_FORMAT = os.getenv("WIRE_FORMAT", "json")
+
+    ###  Rate Limit Settings  ###
+    ## Token buckets as (tokens per second, burst); None disables a single limit
+    RATE_LIMITING = os.getenv("RATE_LIMITING", "1") != "0"
+    MESSAGE_RATE_LIMIT = (5, 10)  # per connection
+    ROOM_MESSAGE_RATE_LIMIT = (50, 100)  # per room, across all members
+    JOIN_RATE_LIMIT = (1, 5)  # per connection
+    ROOM_CREATE_RATE_LIMIT = (0.1, 5)  # per client address
+    IMAGE_RATE_LIMIT = (2 * 1024 * 1024, 24 * 1024 * 1024)  # in bytes, per client
+
+    ###  Restart Settings  ###
+    ## Save rooms and their history here when the server shuts down and load
+    ## them on the next start, so restarts keep rooms alive. Use a private
+    ## path; images only survive with a persistent BLOB_STORAGE_DIR
+    SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH")
+
+    ###  Sharding Settings  ###
+    ## Worker processes started by router.py, each owning the rooms whose code
+    ## hashes to it, so fan-out stays in one process without a message queue
+    SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", os.cpu_count() or 1))
+    SHARD_PORT_BASE = 9100  # workers listen on localhost from this port up
+    SHARD = None  # (index, count) of a worker, set by router.py
+
+    ###  Scaling Settings  ###
+    ## Share rooms between several server processes through a Redis server
+    ## Example: REDIS_URL = "redis://localhost:6379/0" (requires the redis package)
+    REDIS_URL = os.getenv("REDIS_URL")
+    REDIS_KEY_PREFIX = "whisperchat"
+    HANDLER_WORKERS = 32  # threads for Socket.IO handlers in asyncio mode with Redis
+
+    ###  Metrics Settings  ###
+    ## Bearer token for /api/metrics; only loopback clients may scrape when unset
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+    ###  Profiling Settings  ###
+    ## Record CPU and wall time of handlers, routes, emits and background
+    ## callbacks, log slow ones and serve sampling profiles on
+    ## /api/admin/profile (same access rules as /api/metrics)
+    PROFILING = os.getenv("PROFILING", "0") == "1"
+    SLOW_EVENT_THRESHOLD = 0.25  # in seconds of wall time before an event is logged
+    PROFILE_MAX_SECONDS = 30.0  # longest sampling profile
+    PROFILE_SAMPLE_INTERVAL = 0.005  # in seconds
 
     ###  Image Settings  ###
     MAX_IMAGE_SIZE = 24 * 1024 * 1024  # 24MB
     ALLOWED_IMAGE_FORMATS = ["JPEG", "PNG", "GIF", "WEBP"]
+    ## Directory for uploaded image blobs; a temporary directory when unset
+    BLOB_STORAGE_DIR = os.getenv("BLOB_STORAGE_DIR")
+    IMAGE_CACHE_MAX_AGE = 31536000  # in seconds, blobs are content-addressed
+    IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # hot images served from memory
+    IMAGE_WORKERS = 4  # image processes, and send_message threads in asyncio mode
+    IMAGE_QUEUE_SIZE = 16  # images in flight before uploads are rejected
+    IMAGE_PROCESS_TIMEOUT = 30.0  # in seconds
+    IMAGE_MAX_DIMENSION = 2048  # in pixels, larger images are downscaled
+    THUMBNAIL_SIZE = 320  # in pixels
+    IMAGE_QUALITY = 85  # WEBP quality
 
     ###  ANSI colors for console output  ###
     class Colors:
@@ -71,10 +181,14 @@ class ColorFormatter(logging.Formatter):
 # ============================ #
 #  CHAT SERVER IMPLEMENTATION  #
 # ============================ #
-class ChatServer:
-    """Main chat server implementation"""
+class BaseChatServer:
+    """Chat protocol shared by the WSGI and ASGI servers
+
+    Subclasses provide the Socket.IO transport by implementing
+    _transport_emit, _enter_room, _leave_room and _start_background_task.
+    """
 
-    def __init__(self, host=None, port=None):
+    def __init__(self, host=None, port=None, store=None):
         self.app = Flask(f"{Config.APP_NAME}-API")
         self.app.config["SECRET_KEY"] = Config.SECRET_KEY
         self.app.config["MAX_CONTENT_LENGTH"] = Config.MAX_IMAGE_SIZE
@@ -82,58 +196,214 @@ class ChatServer:
         self.app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 0
 
         CORS(self.app, resources={r"/api/*": {"origins": Config.ORIGINS}})
-        self.socketio = SocketIO(
-            self.app, cors_allowed_origins="*", logger=True, manage_session=False
-        )
+
+        self.shards = None
+        if Config.SHARD:
+            # Behind router.py, the client address arrives in X-Forwarded-For
+            self.app.wsgi_app = ProxyFix(self.app.wsgi_app, x_for=1)
+            self.shards = HashRing(range(Config.SHARD[1]))
 
         self.host = host or Config.HOST
+        self.epoch_timestamps = Config.WIRE_FORMAT == "msgpack"
         self.port = port or Config.PORT
-        self.rooms = {}
-        self.user_sessions = {}
-        self.room_cleanup_timers = {}
+        self.store = store or self._create_store()
+        self.engine = ChatEngine(
+            self.store,
+            code_length=Config.ROOM_CODE_LENGTH,
+            cleanup_delay=Config.ROOM_CLEANUP_DELAY,
+            idle_timeout=Config.ROOM_IDLE_TIMEOUT,
+            page_size=Config.HISTORY_PAGE_SIZE,
+            sync_limit=Config.HISTORY_SYNC_LIMIT,
+            sweep_interval=Config.CLEANUP_SWEEP_INTERVAL,
+            reconcile_interval=Config.CLEANUP_RECONCILE_INTERVAL,
+            accept_code=self._owns_room if self.shards else None,
+            on_expire=self._room_expired,
+        )
+        self.room_codes = self.engine.room_codes
+        self.cleanup_scheduler = self.engine.scheduler
+        self.blobs = BlobStore(
+            root=Config.BLOB_STORAGE_DIR,
+            max_size=Config.MAX_IMAGE_SIZE,
+            allowed_formats=Config.ALLOWED_IMAGE_FORMATS,
+        )
+        self.image_cache = ImageCache(Config.IMAGE_CACHE_MAX_BYTES)
+        self.images = ImagePipeline(
+            self.blobs,
+            workers=Config.IMAGE_WORKERS,
+            queue_size=Config.IMAGE_QUEUE_SIZE,
+            max_dimension=Config.IMAGE_MAX_DIMENSION,
+            thumbnail_size=Config.THUMBNAIL_SIZE,
+            quality=Config.IMAGE_QUALITY,
+            timeout=Config.IMAGE_PROCESS_TIMEOUT,
+            cache=self.image_cache,
+        )
+        self.batcher = None
+        if Config.MESSAGE_BATCH_WINDOW > 0:
+            self.batcher = BroadcastBatcher(
+                self._broadcast_messages,
+                window=Config.MESSAGE_BATCH_WINDOW,
+                max_batch=Config.MESSAGE_BATCH_MAX,
+            )
+        self.assets = None
+        if Config.FRONTEND_DIR and os.path.isdir(Config.FRONTEND_DIR):
+            self.assets = StaticAssets(Config.FRONTEND_DIR)
+        self.presence = PresenceThrottle(
+            self._send_presence, interval=Config.PRESENCE_INTERVAL
+        )
+        self.typing_refreshed = {}
+        self.throttled = {}
+        self.draining = False
         self.logger = logging.getLogger(__name__)
+        self.metrics = MetricsRegistry()
+
+        self.message_limiter = self._create_limiter(Config.MESSAGE_RATE_LIMIT)
+        self.room_message_limiter = self._create_limiter(Config.ROOM_MESSAGE_RATE_LIMIT)
+        self.join_limiter = self._create_limiter(Config.JOIN_RATE_LIMIT)
+        self.room_create_limiter = self._create_limiter(Config.ROOM_CREATE_RATE_LIMIT)
+        self.image_limiter = self._create_limiter(Config.IMAGE_RATE_LIMIT)
 
         self._setup_logging()
+        self._setup_metrics()
         self._setup_routes()
-        self._setup_socket_handlers()
+        self.profiler = None
+        if Config.PROFILING:
+            self._setup_profiling()
+
+    def _emit(self, event, data, to, skip=None):
+        """Send an event to a socket id or room, except to sids in `skip`"""
+        size = payload_size(data)
+        self.emitted.inc(event)
+        self.emitted_bytes.inc(event, amount=size)
+        if not self.profiler:
+            self._transport_emit(event, data, to, skip)
+            return
+
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        try:
+            self._transport_emit(event, data, to, skip)
+        finally:
+            self._record_profile("emit", event, started, cpu_started, size)
+
+    def _transport_emit(self, event, data, to, skip):
+        """Hand an event to the Socket.IO transport"""
+        raise NotImplementedError
+
+    def _room_backlogs(self, room_code):
+        """Map local sids in a room to their undelivered packet counts"""
+        raise NotImplementedError
+
+    def _participant_backlogs(self, server, room_code):
+        """Read outbound queue lengths from a python-socketio server"""
+        backlogs = {}
+        for sid, eio_sid in server.manager.get_participants("/", room_code):
+            socket = server.eio.sockets.get(eio_sid)
+            if socket is not None:
+                backlogs[sid] = socket.queue.qsize()
+        return backlogs
+
+    def _enter_room(self, sid, room_code):
+        """Add a socket to a Socket.IO room"""
+        raise NotImplementedError
+
+    def _leave_room(self, sid, room_code):
+        """Remove a socket from a Socket.IO room"""
+        raise NotImplementedError
+
+    def _start_background_task(self, target, *args, **kwargs):
+        """Run a long-lived task alongside the server"""
+        raise NotImplementedError
+
+    def _create_store(self):
+        """Create the room store selected by configuration"""
+        if Config.REDIS_URL:
+            return RedisRoomStore(
+                Config.REDIS_URL,
+                Config.HISTORY_MAX_MESSAGES,
+                Config.HISTORY_MAX_BYTES,
+                prefix=Config.REDIS_KEY_PREFIX,
+            )
+        return MemoryRoomStore(
+            Config.HISTORY_MAX_MESSAGES,
+            Config.HISTORY_MAX_BYTES,
+            spill_dir=Config.HISTORY_SPILL_DIR,
+            hot_messages=Config.HISTORY_HOT_MESSAGES,
+        )
 
-    def _generate_room_code(self, length=None):
-        """Generate unique room code"""
-        length = length or Config.ROOM_CODE_LENGTH
-        while True:
-            code = "".join(random.choices(ascii_uppercase, k=length))
-            if code not in self.rooms:
-                return code
+    def _serializer(self):
+        """Socket.IO packet serializer for the configured wire format"""
+        if Config.WIRE_FORMAT == "msgpack":
+            return "msgpack"
+        return "default"
+
+    def _timestamp(self):
+        """Current time in the configured wire format"""
+        return format_timestamp(epoch_ms(), self.epoch_timestamps)
+
+    def _create_limiter(self, limit):
+        """Create a token bucket limiter, None when the limit is disabled"""
+        if not Config.RATE_LIMITING or limit is None:
+            return None
+        rate, burst = limit
+        return RateLimiter(rate, burst)
+
+    def _rate_limited(self, limiter, key, cost=1, name=None):
+        """Check a limiter, returns True when the request must be rejected"""
+        if limiter is None or limiter.allow(key, cost):
+            return False
+        self.rate_limited.inc(name)
+        return True
+
+    def _forget_client(self, sid):
+        """Release per-connection rate limit state"""
+        for limiter in (self.message_limiter, self.join_limiter, self.image_limiter):
+            if limiter:
+                limiter.forget(sid)
+        self.typing_refreshed.pop(sid, None)
+
+    def _owns_room(self, room_code):
+        """Check if the router sends a room to this shard"""
+        return self.shards.node_for(room_code) == Config.SHARD[0]
 
     def _validate_image(self, image_data):
-        """Validate image format and size"""
+        """Validate an inline image and run it through the pipeline
+
+        Accepts raw bytes from binary clients or base64 text from JSON
+        clients. Returns ((image_id, thumbnail_id), error).
+        """
+        started = time.perf_counter()
         try:
-            if "," in image_data:
-                image_data = image_data.split(",")[1]
+            if isinstance(image_data, bytes):
+                image_bytes = image_data
+            else:
+                if "," in image_data:
+                    image_data = image_data.split(",")[1]
+                image_bytes = base64.b64decode(image_data)
 
-            image_bytes = base64.b64decode(image_data)
             if len(image_bytes) > Config.MAX_IMAGE_SIZE:
                 return (
                     None,
                     f"Image size too large (max {Config.MAX_IMAGE_SIZE // (1024*1024)}MB)",
                 )
 
-            try:
-                image = Image.open(BytesIO(image_bytes))
-                if image.format not in Config.ALLOWED_IMAGE_FORMATS:
-                    return (
-                        None,
-                        f"Unsupported image format: {image.format}. Allowed: {', '.join(Config.ALLOWED_IMAGE_FORMATS)}",
-                    )
-            except Exception as img_error:
-                self.logger.warning(f"Image format validation failed: {img_error}")
-                pass
-
-            return image_data, None
+            image_id, thumbnail_id, timings = self.images.process_bytes(image_bytes)
+            self._log_image_timings(timings)
+            self.image_seconds.observe(time.perf_counter() - started, "validate")
+            return (image_id, thumbnail_id), None
 
+        except BlobError as e:
+            return None, e.message
         except Exception as e:
             return None, f"Invalid image: {str(e)}"
 
+    def _log_image_timings(self, timings):
+        """Log and record per-stage image pipeline timings"""
+        for stage, duration in timings.items():
+            self.image_seconds.observe(duration, stage)
+        stages = ", ".join(
+            f"{stage} {duration * 1000:.1f}ms" for stage, duration in timings.items()
+        )
+        self.logger.info(f"Image processed ({stages})")
+
     def _setup_logging(self):
         """Configure application logging with colors"""
         handler = logging.StreamHandler()
@@ -152,23 +422,240 @@ class ChatServer:
             }
         )
 
+    def _setup_metrics(self):
+        """Register counters, histograms and gauges"""
+        metrics = self.metrics
+        self.connections = metrics.counter(
+            "connections_total", "Socket.IO connections and disconnections", ["state"]
+        )
+        self.events = metrics.counter(
+            "events_total", "Socket.IO events received", ["event"]
+        )
+        self.event_bytes = metrics.counter(
+            "event_bytes_total", "Approximate bytes received per event", ["event"]
+        )
+        self.emitted = metrics.counter(
+            "emitted_total", "Socket.IO events sent", ["event"]
+        )
+        self.emitted_bytes = metrics.counter(
+            "emitted_bytes_total", "Approximate bytes sent per event", ["event"]
+        )
+        self.rate_limited = metrics.counter(
+            "rate_limited_total", "Requests rejected by rate limits", ["limit"]
+        )
+        self.handler_seconds = metrics.histogram(
+            "handler_seconds",
+            "Time spent in Socket.IO event handlers",
+            metrics.LATENCY_BUCKETS,
+            ["event"],
+        )
+        self.image_seconds = metrics.histogram(
+            "image_processing_seconds",
+            "Image pipeline time per stage",
+            metrics.LATENCY_BUCKETS,
+            ["stage"],
+        )
+        self.fanout = metrics.histogram(
+            "message_fanout",
+            "Room members a chat message is broadcast to",
+            metrics.FANOUT_BUCKETS,
+        )
+        self.batch_size = metrics.histogram(
+            "message_batch_size",
+            "Chat messages coalesced into one new_messages broadcast",
+            metrics.FANOUT_BUCKETS,
+        )
+        self.history_bytes = metrics.histogram(
+            "history_payload_bytes",
+            "Approximate size of the history sent on join",
+            metrics.SIZE_BUCKETS,
+        )
+        metrics.gauge(
+            "connected_clients",
+            "Currently connected clients",
+            lambda: self.connections.value("connect")
+            - self.connections.value("disconnect"),
+        )
+        metrics.gauge(
+            "active_rooms", "Rooms held by the store", lambda: self.store.room_count()
+        )
+        metrics.gauge(
+            "room_code_headroom",
+            "Room codes still free for new rooms",
+            lambda: self.room_codes.headroom(self.store.room_count()),
+        )
+        metrics.gauge(
+            "pending_cleanups",
+            "Room cleanup timers waiting to fire",
+            lambda: self.cleanup_scheduler.pending,
+        )
+        metrics.gauge(
+            "history_spilled_bytes",
+            "Encrypted room history held on disk",
+            lambda: self.store.spilled_bytes(),
+        )
+        metrics.gauge(
+            "batched_messages",
+            "Messages waiting in the broadcast batcher",
+            lambda: self.batcher.pending if self.batcher else 0,
+        )
+        metrics.gauge(
+            "pending_presence_rooms",
+            "Rooms waiting for a throttled presence snapshot",
+            lambda: self.presence.pending,
+        )
+        self.throttles = metrics.counter(
+            "slow_consumer_throttles_total",
+            "Connections held back for a full outbound queue",
+        )
+        metrics.gauge(
+            "throttled_clients",
+            "Connections currently held back until they resync",
+            lambda: len(self.throttled),
+        )
+        metrics.gauge(
+            "image_cache_bytes",
+            "Image bytes held in the shared image cache",
+            lambda: self.image_cache.size,
+        )
+        metrics.sampled_histogram(
+            "room_memory_bytes",
+            "Approximate history bytes held per room",
+            metrics.SIZE_BUCKETS,
+            self.store.memory_estimates,
+        )
+
+    def _setup_profiling(self):
+        """Time routes and background callbacks and serve sampling profiles"""
+        metrics = self.metrics
+        self.profiler = SamplingProfiler(Config.PROFILE_SAMPLE_INTERVAL)
+        self.wall_seconds = metrics.histogram(
+            "profile_wall_seconds",
+            "Wall time of profiled events, routes and background callbacks",
+            metrics.LATENCY_BUCKETS,
+            ["kind", "name"],
+        )
+        self.cpu_seconds = metrics.histogram(
+            "profile_cpu_seconds",
+            "CPU time of profiled events, routes and background callbacks",
+            metrics.LATENCY_BUCKETS,
+            ["kind", "name"],
+        )
+        self.slow_events = metrics.counter(
+            "slow_events_total",
+            "Profiled work slower than the slow event threshold",
+            ["kind", "name"],
+        )
+
+        self.cleanup_scheduler.callback = self._profiled(
+            "cleanup", self.cleanup_scheduler.callback
+        )
+        self.presence.flush = self._profiled("presence", self.presence.flush)
+        if self.batcher:
+            self.batcher.flush = self._profiled("batch", self.batcher.flush)
+
+        @self.app.before_request
+        def start_request_profile():
+            g.profile_started = time.perf_counter(), time.thread_time()
+
+        @self.app.teardown_request
+        def record_request_profile(error=None):
+            started = g.pop("profile_started", None)
+            if started:
+                size = request.content_length or 0
+                self._record_profile("route", request.endpoint, *started, size)
+
+        @self.app.route("/api/admin/profile", methods=["GET"])
+        def profile():
+            """Sample all threads and return folded stacks"""
+            self._require_admin()
+            seconds = request.args.get("seconds", 5.0, type=float)
+            seconds = max(0.1, min(seconds, Config.PROFILE_MAX_SECONDS))
+            stacks = self.profiler.profile(seconds)
+            if stacks is None:
+                return jsonify({"error": "A profile is already running"}), 409
+            return stacks, 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+    def _profiled(self, name, callback):
+        """Wrap a background callback to record its timings"""
+
+        def profiled_callback(*args):
+            started, cpu_started = time.perf_counter(), time.thread_time()
+            try:
+                return callback(*args)
+            finally:
+                self._record_profile("task", name, started, cpu_started)
+
+        return profiled_callback
+
+    def _record_profile(self, kind, name, started, cpu_started, size=0):
+        """Record timings of a unit of work, logging it if it was slow"""
+        wall = time.perf_counter() - started
+        cpu = time.thread_time() - cpu_started
+        name = name or "unknown"
+        self.wall_seconds.observe(wall, kind, name)
+        self.cpu_seconds.observe(cpu, kind, name)
+        if wall >= Config.SLOW_EVENT_THRESHOLD:
+            self.slow_events.inc(kind, name)
+            self.logger.warning(
+                f"Slow {kind} {name}: {wall * 1000:.1f}ms wall, "
+                f"{cpu * 1000:.1f}ms CPU, {size} bytes"
+            )
+
+    def _require_admin(self):
+        """Accept the metrics bearer token, or loopback clients when none is set
+
+        The Host header is client controlled, so without a token the
+        connection's own address decides.
+        """
+        if Config.METRICS_TOKEN:
+            expected = f"Bearer {Config.METRICS_TOKEN}"
+            provided = request.headers.get("Authorization", "")
+            if not secrets.compare_digest(provided, expected):
+                abort(401)
+            return
+        try:
+            loopback = ipaddress.ip_address(request.remote_addr or "").is_loopback
+        except ValueError:
+            loopback = False
+        if not loopback:
+            abort(403)
+
     def _setup_routes(self):
         """Setup Flask API routes"""
 
         @self.app.route("/api/serverinfo", methods=["GET"])
         def server_info():
             """Get server information"""
-            allowed_host = f"localhost:{Config.PORT}"
-            if request.host != allowed_host:
-                abort(403, description="Invalid Host Header")
+            self._require_admin()
             return jsonify(
                 {
                     "service": Config.APP_NAME,
                     "version": Config.VERSION,
-                    "active_rooms": len(self.rooms),
+                    "active_rooms": self.store.room_count(),
+                    "room_code_headroom": self.room_codes.headroom(
+                        self.store.room_count()
+                    ),
+                    "pending_cleanups": self.cleanup_scheduler.pending,
+                    "draining": self.draining,
                 }
             )
 
+        @self.app.route("/api/metrics", methods=["GET"])
+        def metrics():
+            """Expose metrics in the Prometheus text format"""
+            self._require_admin()
+            return (
+                self.metrics.render(),
+                200,
+                {"Content-Type": self.metrics.CONTENT_TYPE},
+            )
+
+        @self.app.route("/api/transport", methods=["GET"])
+        def transport():
+            """Wire format clients must use for the Socket.IO connection"""
+            return jsonify({"wire_format": Config.WIRE_FORMAT})
+
         @self.app.route("/api/rooms", methods=["POST"])
         def create_room():
             """Create a new chat room"""
@@ -178,17 +665,15 @@ class ChatServer:
             if not username:
                 return jsonify({"error": "Username is required"}), 400
 
-            room_code = self._generate_room_code()
-            self.rooms[room_code] = {
-                "members": 0,
-                "messages": [],
-                "created_at": datetime.now().isoformat(),
-                "last_activity": datetime.now(),
-            }
+            if self.draining:
+                return jsonify({"error": "Server is restarting, try again"}), 503
 
-            if room_code in self.room_cleanup_timers:
-                self.room_cleanup_timers[room_code].cancel()
-                del self.room_cleanup_timers[room_code]
+            if self._rate_limited(
+                self.room_create_limiter, request.remote_addr, name="create_room"
+            ):
+                return jsonify({"error": "Too many rooms created, slow down"}), 429
+
+            room_code = self.engine.create()
 
             self.logger.info(f"Room created: {room_code}")
             return jsonify(
@@ -198,9 +683,78 @@ class ChatServer:
         @self.app.route("/api/rooms/<room_code>/exists", methods=["GET"])
         def check_room(room_code):
             """Check if room exists"""
-            exists = room_code in self.rooms
+            exists = self.engine.exists(room_code)
             return jsonify({"exists": exists})
 
+        @self.app.route("/api/rooms/<room_code>/images", methods=["POST"])
+        def upload_image(room_code):
+            """Stream an image upload into the blob store"""
+            if not self.engine.exists(room_code):
+                return jsonify({"error": "Room does not exist"}), 404
+
+            # Uploads without a Content-Length are charged the maximum size
+            size = request.content_length or Config.MAX_IMAGE_SIZE
+            if self._rate_limited(
+                self.image_limiter, request.remote_addr, size, name="image"
+            ):
+                return jsonify({"error": "Too many images uploaded, slow down"}), 429
+
+            try:
+                staged = self.blobs.stage_stream(request.stream)
+                image_id, thumbnail_id, timings = self.images.process(*staged)
+            except BlobError as e:
+                return jsonify({"error": e.message}), e.status
+
+            self.store.add_image(room_code, image_id)
+            self.store.add_image(room_code, thumbnail_id)
+            self.logger.info(f"Image uploaded to {room_code} ({staged[1]} bytes)")
+            self._log_image_timings(timings)
+            return (
+                jsonify(
+                    {
+                        "image_id": image_id,
+                        "thumbnail_id": thumbnail_id,
+                        "size": staged[1],
+                    }
+                ),
+                201,
+            )
+
+        @self.app.route("/api/images/<image_id>", methods=["GET"])
+        def get_image(image_id):
+            """Serve a stored image with ETag and range support"""
+            # Another process sharing the blob store may have deleted it
+            if not self.blobs.exists(image_id):
+                self.image_cache.release(image_id)
+                abort(404)
+
+            data = self.image_cache.get(image_id)
+            if data is None:
+                path = self.blobs.path(image_id)
+                try:
+                    size = os.path.getsize(path)
+                except FileNotFoundError:
+                    abort(404)
+                # Stream what the cache would not keep, and ranges of a miss
+                if request.range or not self.image_cache.fits(size):
+                    return self._send_image(path, image_id)
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    abort(404)
+                self.image_cache.put(image_id, data)
+
+            return self._send_image(BytesIO(data), image_id)
+
+        if self.assets:
+
+            @self.app.route("/", defaults={"path": "index.html"})
+            @self.app.route("/<path:path>")
+            def frontend(path):
+                """Serve the web client"""
+                return self.assets.serve(path)
+
         @self.app.after_request
         def add_security_headers(response):
             """Add security headers to responses"""
@@ -212,182 +766,450 @@ class ChatServer:
             )
             return response
 
-    def _schedule_room_cleanup(self, room_code):
-        """Schedule room cleanup after delay"""
-        if room_code in self.room_cleanup_timers:
-            self.room_cleanup_timers[room_code].cancel()
-
-        def cleanup():
-            if room_code in self.rooms and self.rooms[room_code]["members"] == 0:
-                del self.rooms[room_code]
-                self.logger.info(
-                    f"Room {room_code} cleaned up after being empty for {Config.ROOM_CLEANUP_DELAY} seconds"
-                )
-            if room_code in self.room_cleanup_timers:
-                del self.room_cleanup_timers[room_code]
-
-        timer = threading.Timer(Config.ROOM_CLEANUP_DELAY, cleanup)
-        timer.daemon = True
-        timer.start()
-        self.room_cleanup_timers[room_code] = timer
-
-    def _setup_socket_handlers(self):
-        """Setup Socket.IO event handlers"""
-
-        @self.socketio.on("connect")
-        def handle_connect():
-            """Handle client connection"""
-            self.logger.info(f"Client connected: {request.sid}")
-            self.user_sessions[request.sid] = {}
-
-        @self.socketio.on("disconnect")
-        def handle_disconnect():
-            """Handle client disconnection"""
-            self.logger.info(f"Client disconnected: {request.sid}")
-            if request.sid in self.user_sessions:
-                session_data = self.user_sessions[request.sid]
-                room_code = session_data.get("room_code")
-                username = session_data.get("username")
-
-                if room_code and room_code in self.rooms:
-                    self.rooms[room_code]["members"] -= 1
-                    self.rooms[room_code]["last_activity"] = datetime.now()
-
-                    if self.rooms[room_code]["members"] <= 0:
-                        self._schedule_room_cleanup(room_code)
-                    else:
-                        emit(
-                            "user_left",
-                            {
-                                "username": username,
-                                "timestamp": datetime.now().isoformat(),
-                                "member_count": self.rooms[room_code]["members"],
-                            },
-                            to=room_code,
-                        )
-
-                del self.user_sessions[request.sid]
-
-        @self.socketio.on("join")
-        def handle_join(data):
-            """Handle user joining room"""
-            room_code = data.get("room_code")
-            username = data.get("username")
-
-            if not room_code or not username:
-                emit("error", {"message": "Room code and username are required"})
-                return
-
-            if room_code not in self.rooms:
-                emit("error", {"message": "Room does not exist"})
-                return
-
-            if room_code in self.room_cleanup_timers:
-                self.room_cleanup_timers[room_code].cancel()
-                del self.room_cleanup_timers[room_code]
-                self.logger.info(f"Room {room_code} cleanup cancelled - user rejoined")
-
-            self.user_sessions[request.sid] = {
-                "room_code": room_code,
-                "username": username,
-            }
-
-            join_room(room_code)
-            self.rooms[room_code]["members"] += 1
-            self.rooms[room_code]["last_activity"] = datetime.now()
+    def _send_image(self, source, image_id):
+        """Respond with image bytes from a path or buffer"""
+        return send_file(
+            source,
+            download_name=image_id,
+            conditional=True,
+            etag=image_id.split(".")[0],
+            max_age=Config.IMAGE_CACHE_MAX_AGE,
+        )
 
-            emit(
-                "user_joined",
+    def _history_page(self, room_code, before=None, limit=None):
+        """Build a history payload for a room"""
+        messages, cursor = self.engine.history(room_code, before, limit)
+        return {
+            "messages": [
+                message.to_dict(self.epoch_timestamps) for message in messages
+            ],
+            "cursor": cursor,
+            "delta": False,
+        }
+
+    def _history_since(self, room_code, last_seen_seq):
+        """Build a delta history payload, or None if a full resend is needed"""
+        messages = self.engine.history_since(room_code, last_seen_seq)
+        if messages is None:
+            return None
+        return {
+            "messages": [
+                message.to_dict(self.epoch_timestamps) for message in messages
+            ],
+            "delta": True,
+        }
+
+    def _broadcast_messages(self, room_code, messages):
+        """Send a batch of coalesced chat messages to a room"""
+        self.batch_size.observe(len(messages))
+        self._deliver("new_messages", {"messages": messages}, room_code)
+
+    def _deliver(self, event, data, room_code):
+        """Broadcast chat traffic to a room, holding back lagging members
+
+        A member whose outbound queue reaches the high-water mark gets a
+        single resync request instead of further messages. It fetches what
+        it missed as one history delta, or is sent that delta with the
+        next broadcast after its queue has drained to the low-water mark.
+        """
+        if Config.OUTBOUND_HIGH_WATER is None:
+            self._emit(event, data, to=room_code)
+            return
+
+        messages = data["messages"] if event == "new_messages" else [data]
+        low_water = min(Config.OUTBOUND_LOW_WATER, Config.OUTBOUND_HIGH_WATER // 2)
+        skip = []
+        for sid, backlog in self._room_backlogs(room_code).items():
+            if sid in self.throttled:
+                skip.append(sid)
+                if backlog <= low_water:
+                    self._resume(sid, room_code, messages[-1]["seq"])
+            elif backlog >= Config.OUTBOUND_HIGH_WATER:
+                self.throttled[sid] = messages[0]["seq"] - 1
+                skip.append(sid)
+                self.throttles.inc()
+                self._emit("resync", {"reason": "backlog"}, to=sid)
+                self.logger.info(f"Throttled {sid} with {backlog} queued packets")
+        self._emit(event, data, to=room_code, skip=skip or None)
+
+    def _resume(self, sid, room_code, through):
+        """Send a drained connection what it missed and deliver to it again"""
+        last_seen_seq = self.throttled.pop(sid, None)
+        if last_seen_seq is None:
+            return
+        self._send_history(sid, room_code, last_seen_seq, through=through)
+        self.logger.info(f"Resumed {sid} after catching up")
+
+    def _send_history(self, sid, room_code, last_seen_seq=None, through=None):
+        """Send missed messages since `last_seen_seq`, or the latest page
+
+        Messages after sequence `through` are left out; they are still on
+        their way to the client in a broadcast.
+        """
+        history = self._history_since(room_code, last_seen_seq)
+        if history is None:
+            history = self._history_page(room_code)
+        if through is not None:
+            history["messages"] = [
+                message for message in history["messages"] if message["seq"] <= through
+            ]
+        self.history_bytes.observe(payload_size(history))
+        self._emit("message_history", history, to=sid)
+
+    def _send_presence(self, room_code):
+        """Send the roster and typing users of a room"""
+        state = self.store.presence(room_code, time.time())
+        if state is None:
+            return
+        members, typing = state
+        self._emit(
+            "presence", {"members": members, "typing": sorted(typing)}, to=room_code
+        )
+        if typing:
+            # Follow up once the earliest typing indicator lapses
+            self.presence.mark(room_code, at=min(typing.values()))
+
+    def _clear_typing(self, sid, room_code):
+        """Clear a connection's typing state, returns True if it was set"""
+        if self.typing_refreshed.pop(sid, None) is None:
+            return False
+        self.store.set_typing(room_code, sid, None)
+        self.presence.mark(room_code)
+        return True
+
+    def _room_expired(self, room_code, orphans):
+        """Release what an expired room held outside the store"""
+        for blob_id in orphans:
+            self.blobs.delete(blob_id)
+            self.image_cache.release(blob_id)
+        if self.room_message_limiter:
+            self.room_message_limiter.forget(room_code)
+        self.logger.info(f"Room {room_code} cleaned up after expiring")
+
+    def drain(self):
+        """Stop taking new work and save live rooms for the next process
+
+        Rooms are snapshotted and closed under their own locks, so a
+        message either makes it into the snapshot or is rejected. Image
+        workers are stopped and a temporary blob directory is removed.
+        """
+        if self.draining:
+            return
+        self.draining = True
+        self.cleanup_scheduler.stop()
+        self.presence.stop()
+        state = self.store.snapshot() if Config.SNAPSHOT_PATH else None
+        if self.batcher:
+            self.batcher.stop()
+        if state and state["rooms"]:
+            self._save_snapshot(state)
+            self.logger.info(f"Saved {len(state['rooms'])} rooms for restart")
+        self.images.shutdown()
+        self.blobs.close()
+
+    def _save_snapshot(self, state):
+        """Atomically write a store snapshot readable only by this user"""
+        temp_path = f"{Config.SNAPSHOT_PATH}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(temp_path, Config.SNAPSHOT_PATH)
+
+    def _restore_snapshot(self):
+        """Load rooms saved by a previous process and reschedule cleanups
+
+        Called by the serving process when it starts. The file is removed
+        once read, so a later crash does not bring back rooms that have
+        expired since.
+        """
+        if not os.path.exists(Config.SNAPSHOT_PATH):
+            return
+        try:
+            with open(Config.SNAPSHOT_PATH) as f:
+                state = json.load(f)
+            restored = self.engine.restore(state)
+        except (ValueError, KeyError, TypeError):
+            self.logger.exception("Ignoring unreadable room snapshot")
+            return
+        finally:
+            os.unlink(Config.SNAPSHOT_PATH)
+
+        self.logger.info(f"Restored {restored} rooms from snapshot")
+
+    def _leave_current_room(self, sid):
+        """Drop a session from its room and notify remaining members"""
+        session_data = self.store.get_session(sid) or {}
+        room_code = session_data.get("room_code")
+        username = session_data.get("username")
+
+        if not room_code:
+            return None, None
+
+        members = self.engine.leave(room_code)
+        if members is None:
+            return None, None
+
+        self.typing_refreshed.pop(sid, None)
+        self.store.remove_presence(room_code, sid)
+
+        if members > 0:
+            self._emit(
+                "user_left",
                 {
                     "username": username,
-                    "timestamp": datetime.now().isoformat(),
-                    "member_count": self.rooms[room_code]["members"],
+                    "timestamp": self._timestamp(),
+                    "member_count": members,
                 },
                 to=room_code,
             )
+            self.presence.mark(room_code)
+        return room_code, username
+
+    def _socket_handlers(self):
+        """Map Socket.IO event names to protocol handlers"""
+        handlers = {
+            "connect": self.handle_connect,
+            "disconnect": self.handle_disconnect,
+            "join": self.handle_join,
+            "leave": self.handle_leave,
+            "send_message": self.handle_message,
+            "fetch_history": self.handle_fetch_history,
+            "typing": self.handle_typing,
+            "sync": self.handle_sync,
+        }
+        return {
+            event: self._instrumented(event, handler)
+            for event, handler in handlers.items()
+        }
+
+    def _instrumented(self, event, handler):
+        """Wrap a handler to count its events and time its execution"""
+
+        def instrumented_handler(sid, data=None):
+            self.events.inc(event)
+            size = 0
+            if data is not None:
+                size = payload_size(data)
+                self.event_bytes.inc(event, amount=size)
+            started, cpu_started = time.perf_counter(), time.thread_time()
+            try:
+                return handler(sid, data)
+            finally:
+                self.handler_seconds.observe(time.perf_counter() - started, event)
+                if self.profiler:
+                    self._record_profile("event", event, started, cpu_started, size)
+
+        return instrumented_handler
+
+    def handle_connect(self, sid, data=None):
+        """Handle client connection"""
+        self.logger.info(f"Client connected: {sid}")
+        self.connections.inc("connect")
+        self.store.set_session(sid, {})
+
+    def handle_disconnect(self, sid, data=None):
+        """Handle client disconnection"""
+        self.logger.info(f"Client disconnected: {sid}")
+        self.connections.inc("disconnect")
+        self._leave_current_room(sid)
+        self.store.delete_session(sid)
+        self.throttled.pop(sid, None)
+        self._forget_client(sid)
+
+    def handle_join(self, sid, data):
+        """Handle user joining room"""
+        room_code = data.get("room_code")
+        username = data.get("username")
+
+        if not room_code or not username:
+            self._emit(
+                "error", {"message": "Room code and username are required"}, to=sid
+            )
+            return
 
-            emit("message_history", {"messages": self.rooms[room_code]["messages"]})
-
-            self.logger.info(f"{username} joined room {room_code}")
-
-        @self.socketio.on("leave")
-        def handle_leave():
-            """Handle user leaving room"""
-            if request.sid in self.user_sessions:
-                session_data = self.user_sessions[request.sid]
-                room_code = session_data.get("room_code")
-                username = session_data.get("username")
-
-                if room_code and room_code in self.rooms:
-                    leave_room(room_code)
-                    self.rooms[room_code]["members"] -= 1
-                    self.rooms[room_code]["last_activity"] = datetime.now()
-
-                    if self.rooms[room_code]["members"] <= 0:
-                        self._schedule_room_cleanup(room_code)
-                    else:
-                        emit(
-                            "user_left",
-                            {
-                                "username": username,
-                                "timestamp": datetime.now().isoformat(),
-                                "member_count": self.rooms[room_code]["members"],
-                            },
-                            to=room_code,
-                        )
-
-                    self.logger.info(f"{username} left room {room_code}")
-
-                del self.user_sessions[request.sid]
-
-        @self.socketio.on("send_message")
-        def handle_message(data):
-            """Handle sending messages"""
-            if request.sid not in self.user_sessions:
-                emit("error", {"message": "Not in a room"})
-                return
-
-            session_data = self.user_sessions[request.sid]
-            room_code = session_data.get("room_code")
-            username = session_data.get("username")
-            message_text = data.get("message")
-            image_data = data.get("image")
+        if self.draining:
+            self._emit("error", {"message": "Server is restarting"}, to=sid)
+            return
 
-            if not room_code or room_code not in self.rooms:
-                return
+        if self._rate_limited(self.join_limiter, sid, name="join"):
+            self._emit("error", {"message": "Joining too fast, slow down"}, to=sid)
+            return
 
-            if not message_text and not image_data:
-                return
+        members = self.engine.join(room_code)
+        if members is None:
+            self._emit("error", {"message": "Room does not exist"}, to=sid)
+            return
 
-            self.rooms[room_code]["last_activity"] = datetime.now()
+        self.store.set_session(sid, {"room_code": room_code, "username": username})
+        self.store.add_presence(room_code, sid, username)
+        self._enter_room(sid, room_code)
+        self.presence.mark(room_code)
 
-            message_data = {
-                "id": secrets.token_hex(8),
+        self._emit(
+            "user_joined",
+            {
                 "username": username,
-                "message": message_text,
-                "timestamp": datetime.now().isoformat(),
-            }
-
-            if image_data:
-                validated_image, error = self._validate_image(image_data)
-                if error:
-                    emit("error", {"message": error})
-                    return
-                message_data["image"] = validated_image
-                message_data["type"] = "image"
-                if not message_text:
-                    message_data["message"] = "Sent an image"
-
-            self.rooms[room_code]["messages"].append(message_data)
-            emit("new_message", message_data, to=room_code)
+                "timestamp": self._timestamp(),
+                "member_count": members,
+            },
+            to=room_code,
+        )
 
-            log_message = f"Message from {username} in {room_code}"
-            if image_data:
-                log_message += " (with image)"
-            self.logger.info(log_message)
+        self.throttled.pop(sid, None)
+        self._send_history(sid, room_code, data.get("last_seen_seq"))
+
+        self.logger.info(f"{username} joined room {room_code}")
+
+    def handle_leave(self, sid, data=None):
+        """Handle user leaving room"""
+        if self.store.get_session(sid) is not None:
+            room_code, username = self._leave_current_room(sid)
+            if room_code:
+                self._leave_room(sid, room_code)
+                self.logger.info(f"{username} left room {room_code}")
+
+            self.store.delete_session(sid)
+
+    def handle_message(self, sid, data):
+        """Handle sending messages"""
+        session_data = self.store.get_session(sid)
+        if session_data is None:
+            self._emit("error", {"message": "Not in a room"}, to=sid)
+            return
+
+        room_code = session_data.get("room_code")
+        username = session_data.get("username")
+        message_text = data.get("message")
+        image_data = data.get("image")
+        image_id = data.get("image_id")
+        thumbnail_id = data.get("thumbnail_id")
+
+        if not room_code:
+            return
+
+        if not message_text and not image_data and not image_id:
+            return
+
+        if self.draining:
+            self._emit("error", {"message": "Server is restarting"}, to=sid)
+            return
+
+        limited = self._rate_limited(self.message_limiter, sid, name="message")
+        if limited or self._rate_limited(
+            self.room_message_limiter, room_code, name="room"
+        ):
+            self._emit("error", {"message": "Sending too fast, slow down"}, to=sid)
+            return
+
+        image_size = len(image_data or b"")
+        if not isinstance(image_data, bytes):
+            image_size = image_size * 3 // 4
+        if image_data and self._rate_limited(
+            self.image_limiter, sid, image_size, name="image"
+        ):
+            self._emit("error", {"message": "Too many images sent, slow down"}, to=sid)
+            return
+
+        if image_data and not image_id:
+            image_ids, error = self._validate_image(image_data)
+            if error:
+                self._emit("error", {"message": error}, to=sid)
+                return
+            image_id, thumbnail_id = image_ids
+            self.store.add_image(room_code, image_id)
+            self.store.add_image(room_code, thumbnail_id)
+
+        if image_id:
+            thumbnail_id = thumbnail_id or image_id
+            blob_ids = (image_id, thumbnail_id)
+            if not all(self.store.has_image(room_code, b) for b in blob_ids):
+                self._emit("error", {"message": "Image not found"}, to=sid)
+                return
+            if not message_text:
+                message_text = "Sent an image"
 
-    def start(self, debug=False):
-        """Start the chat server"""
+        message = self.engine.post(
+            room_code, username, message_text, image_id, thumbnail_id
+        )
+        if message is None:
+            return
+        self._clear_typing(sid, room_code)
+        if self.batcher:
+            self.batcher.add(room_code, message.to_dict(self.epoch_timestamps))
+        else:
+            self._deliver(
+                "new_message", message.to_dict(self.epoch_timestamps), room_code
+            )
+        self.fanout.observe(self.store.member_count(room_code))
+
+        log_message = f"Message from {username} in {room_code}"
+        if image_id:
+            log_message += " (with image)"
+        self.logger.info(log_message)
+
+    def handle_typing(self, sid, data):
+        """Handle typing state changes
+
+        Repeated typing events only refresh the deadline every half
+        timeout, and only a change of state marks the room for a snapshot.
+        """
+        session_data = self.store.get_session(sid) or {}
+        room_code = session_data.get("room_code")
+        if not room_code:
+            return
+
+        if not (data or {}).get("typing", True):
+            self._clear_typing(sid, room_code)
+            return
+
+        now = time.time()
+        refreshed = self.typing_refreshed.get(sid)
+        if refreshed is not None and now - refreshed < Config.TYPING_TIMEOUT / 2:
+            return
+
+        self.typing_refreshed[sid] = now
+        self.store.set_typing(room_code, sid, now + Config.TYPING_TIMEOUT)
+        if refreshed is None or now - refreshed >= Config.TYPING_TIMEOUT:
+            self.presence.mark(room_code)
+
+    def handle_sync(self, sid, data):
+        """Handle a throttled client catching up after a resync request
+
+        A connection already resumed after draining has been sent what it
+        missed, so a sync arriving after that is ignored.
+        """
+        session_data = self.store.get_session(sid) or {}
+        room_code = session_data.get("room_code")
+
+        if not room_code or not self.engine.exists(room_code):
+            self._emit("error", {"message": "Not in a room"}, to=sid)
+            return
+
+        if self.throttled.pop(sid, None) is None:
+            return
+        self._send_history(sid, room_code, (data or {}).get("last_seen_seq"))
+
+    def handle_fetch_history(self, sid, data):
+        """Handle paging back through room history"""
+        session_data = self.store.get_session(sid) or {}
+        room_code = session_data.get("room_code")
+
+        if not room_code or not self.engine.exists(room_code):
+            self._emit("error", {"message": "Not in a room"}, to=sid)
+            return
+
+        before = data.get("before")
+        limit = data.get("limit")
+        if not isinstance(before, int) or (
+            limit is not None and not isinstance(limit, int)
+        ):
+            self._emit("error", {"message": "Invalid history cursor"}, to=sid)
+            return
+
+        self._emit("history_page", self._history_page(room_code, before, limit), to=sid)
+
+    def _print_banner(self):
+        """Print startup banner"""
         start_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
         print(
             f"{Config.Colors.GREEN}{start_time} {Config.Colors.AQUA}{Config.APP_NAME} v{Config.VERSION}{Config.Colors.RESET}"
@@ -396,14 +1218,84 @@ class ChatServer:
             f"{Config.Colors.GREEN}Server starting on {Config.Colors.AQUA}http://{self.host}:{self.port}{Config.Colors.RESET}"
         )
 
-        self.socketio.run(
+
+class ChatServer(BaseChatServer):
+    """Main chat server implementation on Flask-SocketIO"""
+
+    def __init__(self, host=None, port=None, store=None):
+        super().__init__(host, port, store)
+        self.socketio = SocketIO(
             self.app,
-            host=self.host,
-            port=self.port,
-            debug=debug,
-            use_reloader=debug,
-            allow_unsafe_werkzeug=debug,
+            cors_allowed_origins="*",
+            logger=True,
+            manage_session=False,
+            message_queue=Config.REDIS_URL,
+            serializer=self._serializer(),
+        )
+
+        self._setup_socket_handlers()
+        self._start_background_task(
+            self.cleanup_scheduler.run, sleep=self.socketio.sleep
         )
+        if self.batcher:
+            self._start_background_task(self.batcher.run, sleep=self.socketio.sleep)
+        self._start_background_task(self.presence.run, sleep=self.socketio.sleep)
+
+    def _transport_emit(self, event, data, to, skip):
+        self.socketio.emit(event, data, to=to, skip_sid=skip)
+
+    def _room_backlogs(self, room_code):
+        return self._participant_backlogs(self.socketio.server, room_code)
+
+    def _enter_room(self, sid, room_code):
+        join_room(room_code, sid=sid)
+
+    def _leave_room(self, sid, room_code):
+        leave_room(room_code, sid=sid)
+
+    def _start_background_task(self, target, *args, **kwargs):
+        return self.socketio.start_background_task(target, *args, **kwargs)
+
+    def _setup_socket_handlers(self):
+        """Setup Socket.IO event handlers"""
+        for event, handler in self._socket_handlers().items():
+            self.socketio.on_event(event, self._bind_handler(handler))
+
+    def _bind_handler(self, handler):
+        """Adapt a protocol handler to Flask-SocketIO's request context"""
+
+        def socket_handler(data=None, *args):
+            return handler(request.sid, data)
+
+        return socket_handler
+
+    def _terminate(self, signum, frame):
+        """Drain on SIGTERM so the next process can pick up the rooms"""
+        self.drain()
+        raise SystemExit(0)
+
+    def start(self, debug=False):
+        """Start the chat server"""
+        self._print_banner()
+
+        # With the reloader, only the child process started by it serves
+        if Config.SNAPSHOT_PATH and (
+            not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+        ):
+            self._restore_snapshot()
+
+        signal.signal(signal.SIGTERM, self._terminate)
+        try:
+            self.socketio.run(
+                self.app,
+                host=self.host,
+                port=self.port,
+                debug=debug,
+                use_reloader=debug,
+                allow_unsafe_werkzeug=debug,
+            )
+        finally:
+            self.drain()
 
 
 if __name__ == "__main__":
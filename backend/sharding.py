@@ -0,0 +1,32 @@
+import bisect
+import hashlib
+
+
+class HashRing:
+    """Consistent hash ring mapping room codes to worker shards
+
+    Each node owns `replicas` points on the ring, which evens out the
+    load and means that changing the number of workers only moves the
+    rooms between neighbouring points.
+    """
+
+    REPLICAS = 64
+
+    def __init__(self, nodes, replicas=REPLICAS):
+        points = sorted(
+            (self._hash(f"{node}-{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self.points = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def node_for(self, key):
+        """Node owning `key`"""
+        index = bisect.bisect(self.points, self._hash(key)) % len(self.points)
+        return self.nodes[index]
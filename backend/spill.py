@@ -0,0 +1,191 @@
+import os
+import json
+import mmap
+import errno
+import logging
+import secrets
+
+from array import array
+from collections import deque
+from itertools import islice
+from history import Message, MessageHistory
+
+
+class Segment:
+    """Append-only file of encrypted message records
+
+    Record offsets stay in memory. No file descriptor is held between
+    calls: appends open the file for one write and reads map it for one
+    page, so the number of segments is not bound by the fd limit. The
+    AES-GCM nonce is the message index, which never repeats under a
+    room's key.
+    """
+
+    def __init__(self, path, cipher, first_index):
+        self.path = path
+        self.cipher = cipher
+        self.first_index = first_index
+        self.offsets = array("Q")
+        self.size = 0
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def end_index(self):
+        """Index after the last stored record"""
+        return self.first_index + len(self.offsets)
+
+    def append(self, index, data):
+        """Encrypt and append the record for message `index`
+
+        Writes at the known end of the records, so whatever a failed
+        write left behind is overwritten by the next one.
+        """
+        sealed = self.cipher.encrypt(index.to_bytes(12, "big"), data, None)
+        fd = os.open(self.path, os.O_WRONLY)
+        try:
+            if os.pwrite(fd, sealed, self.size) != len(sealed):
+                raise OSError(errno.ENOSPC, "Short write", self.path)
+        finally:
+            os.close(fd)
+        self.offsets.append(self.size)
+        self.size += len(sealed)
+
+    def read(self, start, end):
+        """Decrypt the records for messages `start` up to `end`"""
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            view = mmap.mmap(fd, self.size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        with view:
+            records = []
+            for index in range(start, end):
+                position = index - self.first_index
+                record_end = (
+                    self.offsets[position + 1]
+                    if position + 1 < len(self.offsets)
+                    else self.size
+                )
+                sealed = view[self.offsets[position] : record_end]
+                records.append(
+                    self.cipher.decrypt(index.to_bytes(12, "big"), sealed, None)
+                )
+            return records
+
+    def delete(self):
+        """Remove the file"""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class SpillingHistory(MessageHistory):
+    """Message history that keeps only a hot window in memory
+
+    Messages pushed out of the window go to encrypted segment files under
+    `directory` until `max_messages` in total are retained; whole segments
+    are unlinked once all their messages have aged out. The key exists only
+    in this object, so the files are unreadable once the room is gone.
+    """
+
+    def __init__(
+        self,
+        max_messages,
+        max_bytes,
+        directory,
+        hot_messages=200,
+        segment_messages=None,
+    ):
+        try:
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        except ImportError:
+            raise RuntimeError(
+                "The cryptography package is required for spilled history"
+            )
+
+        super().__init__(min(hot_messages, max_messages), max_bytes)
+        self.retain = max_messages
+        self.directory = directory
+        self.segment_messages = segment_messages or max(hot_messages, 1)
+        self.cipher = AESGCM(AESGCM.generate_key(bit_length=256))
+        self.name = secrets.token_hex(8)
+        self.segments = deque()
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def first_index(self):
+        """Index of the oldest retained message"""
+        if self.segments:
+            oldest = self.segments[0].first_index
+        else:
+            oldest = super().first_index
+        return max(oldest, self.next_index - self.retain)
+
+    @property
+    def spilled_bytes(self):
+        """Bytes of encrypted history on disk"""
+        return sum(segment.size for segment in self.segments)
+
+    def _evict(self, message):
+        try:
+            segment = self.segments[-1] if self.segments else None
+            if segment is None or len(segment) >= self.segment_messages:
+                path = os.path.join(self.directory, f"{self.name}-{message.index}.seg")
+                segment = Segment(path, self.cipher, message.index)
+                self.segments.append(segment)
+
+            record = json.dumps(message.to_record(), separators=(",", ":"))
+            segment.append(message.index, record.encode())
+        except OSError as e:
+            # The message stays in memory and the next append tries again
+            self.logger.warning(f"Could not spill history: {e}")
+            return False
+
+        oldest = self.next_index - self.retain
+        while self.segments and self.segments[0].end_index <= oldest:
+            self.segments.popleft().delete()
+        return True
+
+    def _read(self, start, end):
+        messages = []
+        for segment in self.segments:
+            if segment.end_index <= start or segment.first_index >= end:
+                continue
+            first = max(start, segment.first_index)
+            records = segment.read(first, min(end, segment.end_index))
+            for index, record in enumerate(records, first):
+                messages.append(Message.from_record(json.loads(record), index))
+        return messages
+
+    def page(self, before=None, limit=50):
+        """Return up to `limit` messages older than cursor `before`
+
+        Reads from disk only for the part of the page older than the
+        hot window.
+        """
+        first = self.first_index
+        end = self.next_index
+        if before is not None:
+            end = max(first, min(end, before))
+        start = max(first, end - limit)
+
+        hot_first = super().first_index
+        messages = self._read(start, min(end, hot_first))
+        if end > hot_first:
+            messages.extend(
+                islice(
+                    self.messages, max(start, hot_first) - hot_first, end - hot_first
+                )
+            )
+
+        cursor = start if messages and start > first else None
+        return messages, cursor
+
+    def close(self):
+        """Delete all segment files"""
+        while self.segments:
+            self.segments.popleft().delete()
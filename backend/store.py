@@ -0,0 +1,714 @@
+import os
+import json
+import time
+import threading
+
+from history import Message, MessageHistory
+from spill import SpillingHistory
+
+
+class RoomStore:
+    """Interface for room, history and session state"""
+
+    def create_room(self, room_code):
+        """Create an empty room, returns False if the code is taken"""
+        raise NotImplementedError
+
+    def room_exists(self, room_code):
+        """Check if room exists"""
+        raise NotImplementedError
+
+    def room_count(self):
+        """Number of active rooms"""
+        raise NotImplementedError
+
+    def add_member(self, room_code, delta=1):
+        """Adjust member count, returns the new count or None if room is gone"""
+        raise NotImplementedError
+
+    def remove_member(self, room_code):
+        """Decrement member count"""
+        return self.add_member(room_code, -1)
+
+    def member_count(self, room_code):
+        """Current member count, 0 if room is gone"""
+        raise NotImplementedError
+
+    def memory_estimates(self):
+        """Approximate history bytes held for each room"""
+        raise NotImplementedError
+
+    def spilled_bytes(self):
+        """Bytes of room history spilled to disk, 0 if the store never spills"""
+        return 0
+
+    def add_presence(self, room_code, sid, username):
+        """Add a connection to the room roster"""
+        raise NotImplementedError
+
+    def remove_presence(self, room_code, sid):
+        """Drop a connection from the roster and typing state"""
+        raise NotImplementedError
+
+    def set_typing(self, room_code, sid, until):
+        """Mark a connection as typing until `until`, or clear it with None"""
+        raise NotImplementedError
+
+    def presence(self, room_code, now):
+        """Return (usernames, {typing username: until}), None if room is gone"""
+        raise NotImplementedError
+
+    def append_message(self, room_code, message):
+        """Store a message and assign its index, returns None if room is gone"""
+        raise NotImplementedError
+
+    def history_page(self, room_code, before=None, limit=50):
+        """Return (messages, cursor) for messages older than `before`"""
+        raise NotImplementedError
+
+    def history_since(self, room_code, after, limit=50):
+        """Messages newer than sequence number `after`, oldest first
+
+        Returns None when more than `limit` messages are missing or some
+        were already evicted, so the caller has to resend the history.
+        """
+        messages, _ = self.history_page(room_code, None, limit + 1)
+        if not messages or messages[-1].index < after:
+            return None
+        start = after + 1 - messages[0].index
+        # A page starting right after `after` may still hold every missed
+        # message; only the extra one fetched tells that more are missing
+        if start < 0 or (start == 0 and len(messages) > limit):
+            return None
+        return messages[start:]
+
+    def add_image(self, room_code, blob_id):
+        """Reference an image blob from a room"""
+        raise NotImplementedError
+
+    def has_image(self, room_code, blob_id):
+        """Check if room references an image blob"""
+        raise NotImplementedError
+
+    def schedule_cleanup(self, room_code, deadline):
+        """Mark room for deletion at `deadline` (epoch seconds)"""
+        raise NotImplementedError
+
+    def cancel_cleanup(self, room_code):
+        """Clear a pending deletion, returns True if one was pending"""
+        raise NotImplementedError
+
+    def due_rooms(self, now):
+        """Room codes whose cleanup deadline has passed"""
+        raise NotImplementedError
+
+    def expire_room(self, room_code, now):
+        """Delete room if it is empty and due
+
+        Returns the blob ids no longer referenced by any room, or None
+        when the room was not deleted.
+        """
+        raise NotImplementedError
+
+    def snapshot(self):
+        """Serializable state of every room, closing the rooms for good
+
+        Returns None for stores whose state already outlives the process.
+        """
+        return None
+
+    def restore(self, state, cleanup_at):
+        """Load rooms from a snapshot
+
+        Members have to reconnect, so rooms without a pending cleanup get
+        one at `cleanup_at`. Returns {room_code: cleanup deadline}.
+        """
+        raise NotImplementedError
+
+    def get_session(self, sid):
+        """Session data for a socket id, or None"""
+        raise NotImplementedError
+
+    def set_session(self, sid, data):
+        """Store session data for a socket id"""
+        raise NotImplementedError
+
+    def delete_session(self, sid):
+        """Remove session data for a socket id"""
+        raise NotImplementedError
+
+
+class Room:
+    """In-memory room state guarded by its own lock
+
+    A closed room has been removed from the store; holders of a stale
+    reference see the flag under the lock and treat the room as gone.
+    """
+
+    __slots__ = (
+        "lock",
+        "members",
+        "messages",
+        "images",
+        "roster",
+        "typing",
+        "created_at",
+        "last_activity",
+        "cleanup_at",
+        "closed",
+    )
+
+    def __init__(self, messages):
+        now = time.time()
+        self.lock = threading.Lock()
+        self.members = 0
+        self.messages = messages
+        self.images = set()
+        self.roster = {}
+        self.typing = {}
+        self.created_at = now
+        self.last_activity = now
+        self.cleanup_at = None
+        self.closed = False
+
+
+class MemoryRoomStore(RoomStore):
+    """In-process room store, the default for single worker deployments
+
+    Each room has its own lock, so traffic in one room never waits on
+    another. The store lock only covers the room table and the shared
+    image reference counts, and is always taken after a room lock.
+
+    With `spill_dir` set, only the newest `hot_messages` of each room stay
+    in memory and older ones move to encrypted files in that directory.
+    """
+
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, max_messages, max_bytes, spill_dir=None, hot_messages=200):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.hot_messages = hot_messages
+        if spill_dir:
+            self._reset_spill_dir()
+        self.rooms = {}
+        self.sessions = {}
+        self.image_refs = {}
+        self.lock = threading.Lock()
+
+    def create_room(self, room_code):
+        with self.lock:
+            if room_code in self.rooms:
+                return False
+            self.rooms[room_code] = Room(self._create_history())
+            return True
+
+    def _create_history(self):
+        if self.spill_dir:
+            return SpillingHistory(
+                self.max_messages,
+                self.max_bytes,
+                self.spill_dir,
+                hot_messages=self.hot_messages,
+            )
+        return MessageHistory(self.max_messages, self.max_bytes)
+
+    def _reset_spill_dir(self):
+        # Segments from an earlier process are unreadable without its keys
+        os.makedirs(self.spill_dir, mode=0o700, exist_ok=True)
+        for name in os.listdir(self.spill_dir):
+            if name.endswith(".seg"):
+                os.unlink(os.path.join(self.spill_dir, name))
+
+    def room_exists(self, room_code):
+        return room_code in self.rooms
+
+    def room_count(self):
+        return len(self.rooms)
+
+    def add_member(self, room_code, delta=1):
+        room = self.rooms.get(room_code)
+        if room is None:
+            return None
+        with room.lock:
+            if room.closed:
+                return None
+            room.members += delta
+            room.last_activity = time.time()
+            return room.members
+
+    def member_count(self, room_code):
+        room = self.rooms.get(room_code)
+        return room.members if room else 0
+
+    def memory_estimates(self):
+        return [room.messages.total_bytes for room in list(self.rooms.values())]
+
+    def spilled_bytes(self):
+        if not self.spill_dir:
+            return 0
+        return sum(room.messages.spilled_bytes for room in list(self.rooms.values()))
+
+    def add_presence(self, room_code, sid, username):
+        room = self.rooms.get(room_code)
+        if room is None:
+            return
+        with room.lock:
+            room.roster[sid] = username
+
+    def remove_presence(self, room_code, sid):
+        room = self.rooms.get(room_code)
+        if room is None:
+            return
+        with room.lock:
+            room.roster.pop(sid, None)
+            room.typing.pop(sid, None)
+
+    def set_typing(self, room_code, sid, until):
+        room = self.rooms.get(room_code)
+        if room is None:
+            return
+        with room.lock:
+            if until is None:
+                room.typing.pop(sid, None)
+            elif sid in room.roster:
+                room.typing[sid] = until
+
+    def presence(self, room_code, now):
+        room = self.rooms.get(room_code)
+        if room is None:
+            return None
+        with room.lock:
+            if room.closed:
+                return None
+            for sid, until in list(room.typing.items()):
+                if until <= now:
+                    del room.typing[sid]
+            typing = {room.roster[sid]: until for sid, until in room.typing.items()}
+            return sorted(set(room.roster.values())), typing
+
+    def append_message(self, room_code, message):
+        room = self.rooms.get(room_code)
+        if room is None:
+            return None
+        with room.lock:
+            if room.closed:
+                return None
+            room.last_activity = time.time()
+            return room.messages.append(message)
+
+    def history_page(self, room_code, before=None, limit=50):
+        room = self.rooms.get(room_code)
+        if room is None:
+            return [], None
+        with room.lock:
+            return room.messages.page(before, limit)
+
+    def add_image(self, room_code, blob_id):
+        room = self.rooms.get(room_code)
+        if room is None:
+            return
+        with room.lock:
+            if room.closed or blob_id in room.images:
+                return
+            room.images.add(blob_id)
+            with self.lock:
+                self.image_refs[blob_id] = self.image_refs.get(blob_id, 0) + 1
+
+    def has_image(self, room_code, blob_id):
+        room = self.rooms.get(room_code)
+        return room is not None and blob_id in room.images
+
+    def schedule_cleanup(self, room_code, deadline):
+        room = self.rooms.get(room_code)
+        if room is None:
+            return
+        with room.lock:
+            room.cleanup_at = deadline
+
+    def cancel_cleanup(self, room_code):
+        room = self.rooms.get(room_code)
+        if room is None:
+            return False
+        with room.lock:
+            if room.cleanup_at is None:
+                return False
+            room.cleanup_at = None
+            return True
+
+    def due_rooms(self, now):
+        return [
+            room_code
+            for room_code, room in list(self.rooms.items())
+            if room.cleanup_at is not None and room.cleanup_at <= now
+        ]
+
+    def expire_room(self, room_code, now):
+        room = self.rooms.get(room_code)
+        if room is None:
+            return None
+
+        with room.lock:
+            if (
+                room.closed
+                or room.members > 0
+                or room.cleanup_at is None
+                or room.cleanup_at > now
+            ):
+                return None
+            room.closed = True
+            room.messages.close()
+
+            with self.lock:
+                del self.rooms[room_code]
+                orphans = []
+                for blob_id in room.images:
+                    count = self.image_refs.get(blob_id, 0) - 1
+                    if count > 0:
+                        self.image_refs[blob_id] = count
+                    else:
+                        self.image_refs.pop(blob_id, None)
+                        orphans.append(blob_id)
+            return orphans
+
+    def snapshot(self):
+        rooms = {}
+        for room_code, room in list(self.rooms.items()):
+            with room.lock:
+                if room.closed:
+                    continue
+                room.closed = True
+                messages, _ = room.messages.page(None, room.messages.next_index)
+                rooms[room_code] = {
+                    "created_at": room.created_at,
+                    "last_activity": room.last_activity,
+                    "cleanup_at": room.cleanup_at,
+                    "images": sorted(room.images),
+                    "next_index": room.messages.next_index,
+                    "messages": [
+                        [message.index, *message.to_record()] for message in messages
+                    ],
+                }
+                room.messages.close()
+        return {"version": self.SNAPSHOT_VERSION, "rooms": rooms}
+
+    def restore(self, state, cleanup_at):
+        if state.get("version") != self.SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {state.get('version')}")
+
+        deadlines = {}
+        for room_code, data in state["rooms"].items():
+            messages = [
+                Message.from_record(record, index)
+                for index, *record in data["messages"]
+            ]
+            room = Room(self._create_history())
+            room.messages.load(messages, data["next_index"])
+            room.created_at = data["created_at"]
+            room.last_activity = data["last_activity"]
+            room.cleanup_at = data["cleanup_at"] or cleanup_at
+            room.images = set(data["images"])
+
+            with self.lock:
+                if room_code in self.rooms:
+                    continue
+                self.rooms[room_code] = room
+                for blob_id in room.images:
+                    self.image_refs[blob_id] = self.image_refs.get(blob_id, 0) + 1
+            deadlines[room_code] = room.cleanup_at
+        return deadlines
+
+    def get_session(self, sid):
+        return self.sessions.get(sid)
+
+    def set_session(self, sid, data):
+        self.sessions[sid] = data
+
+    def delete_session(self, sid):
+        self.sessions.pop(sid, None)
+
+
+class RedisRoomStore(RoomStore):
+    """Room store backed by a Redis-compatible server
+
+    Lets several server processes share rooms when combined with the
+    Socket.IO message queue. Multi-key updates run as Lua scripts so
+    they stay atomic across processes.
+    """
+
+    SESSION_TTL = 24 * 60 * 60  # in seconds
+
+    CREATE_ROOM = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+    redis.call('HSET', KEYS[1], 'members', 0, 'next_index', 0, 'bytes', 0,
+               'created_at', ARGV[2], 'last_activity', ARGV[2])
+    redis.call('SADD', KEYS[2], ARGV[1])
+    return 1
+    """
+
+    ADD_MEMBER = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+    redis.call('HSET', KEYS[1], 'last_activity', ARGV[2])
+    return redis.call('HINCRBY', KEYS[1], 'members', ARGV[1])
+    """
+
+    APPEND_MESSAGE = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+    local index = redis.call('HINCRBY', KEYS[1], 'next_index', 1) - 1
+    redis.call('HSET', KEYS[1], 'last_activity', ARGV[2])
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    local bytes = redis.call('HINCRBY', KEYS[1], 'bytes', #ARGV[1])
+    local count = redis.call('LLEN', KEYS[2])
+    local max_messages = tonumber(ARGV[3])
+    local max_bytes = tonumber(ARGV[4])
+    while count > 1 and (count > max_messages or bytes > max_bytes) do
+        local oldest = redis.call('LPOP', KEYS[2])
+        bytes = redis.call('HINCRBY', KEYS[1], 'bytes', -#oldest)
+        count = count - 1
+    end
+    return index
+    """
+
+    HISTORY_PAGE = """
+    local total = redis.call('LLEN', KEYS[2])
+    local next_index = tonumber(redis.call('HGET', KEYS[1], 'next_index') or '0')
+    local first = next_index - total
+    local stop = total
+    if ARGV[1] ~= '' then
+        stop = math.max(0, math.min(total, tonumber(ARGV[1]) - first))
+    end
+    local start = math.max(0, stop - tonumber(ARGV[2]))
+    if stop == start then return {first + start, start, {}} end
+    return {first + start, start, redis.call('LRANGE', KEYS[2], start, stop - 1)}
+    """
+
+    ADD_IMAGE = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+    if redis.call('SADD', KEYS[2], ARGV[1]) == 1 then
+        redis.call('HINCRBY', KEYS[3], ARGV[1], 1)
+    end
+    return 1
+    """
+
+    SCHEDULE_CLEANUP = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+    redis.call('HSET', KEYS[1], 'cleanup_at', ARGV[2])
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+    return 1
+    """
+
+    CANCEL_CLEANUP = """
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    return redis.call('HDEL', KEYS[1], 'cleanup_at')
+    """
+
+    ADD_PRESENCE = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+    redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+    return 1
+    """
+
+    SET_TYPING = """
+    if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then return 0 end
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+    return 1
+    """
+
+    EXPIRE_ROOM = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+    local members = tonumber(redis.call('HGET', KEYS[1], 'members') or '0')
+    local cleanup_at = redis.call('HGET', KEYS[1], 'cleanup_at')
+    if members > 0 or not cleanup_at or tonumber(cleanup_at) > tonumber(ARGV[2]) then
+        return false
+    end
+    local orphans = {}
+    for _, blob_id in ipairs(redis.call('SMEMBERS', KEYS[3])) do
+        if redis.call('HINCRBY', KEYS[6], blob_id, -1) <= 0 then
+            redis.call('HDEL', KEYS[6], blob_id)
+            table.insert(orphans, blob_id)
+        end
+    end
+    redis.call('DEL', KEYS[1], KEYS[2], KEYS[3], KEYS[7], KEYS[8])
+    redis.call('SREM', KEYS[4], ARGV[1])
+    redis.call('ZREM', KEYS[5], ARGV[1])
+    return orphans
+    """
+
+    def __init__(self, url, max_messages, max_bytes, prefix="whisperchat", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError(
+                    "The redis package is required for the Redis room store"
+                )
+            client = redis.Redis.from_url(url, decode_responses=True)
+
+        self.redis = client
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.rooms_key = f"{prefix}:rooms"
+        self.cleanup_key = f"{prefix}:cleanup"
+        self.image_refs_key = f"{prefix}:image_refs"
+
+        self._create_room = self.redis.register_script(self.CREATE_ROOM)
+        self._add_member = self.redis.register_script(self.ADD_MEMBER)
+        self._append_message = self.redis.register_script(self.APPEND_MESSAGE)
+        self._history_page = self.redis.register_script(self.HISTORY_PAGE)
+        self._add_image = self.redis.register_script(self.ADD_IMAGE)
+        self._schedule_cleanup = self.redis.register_script(self.SCHEDULE_CLEANUP)
+        self._cancel_cleanup = self.redis.register_script(self.CANCEL_CLEANUP)
+        self._expire_room = self.redis.register_script(self.EXPIRE_ROOM)
+        self._add_presence = self.redis.register_script(self.ADD_PRESENCE)
+        self._set_typing = self.redis.register_script(self.SET_TYPING)
+
+    def _room_key(self, room_code, suffix=None):
+        key = f"{self.prefix}:room:{room_code}"
+        return f"{key}:{suffix}" if suffix else key
+
+    def create_room(self, room_code):
+        return bool(
+            self._create_room(
+                keys=[self._room_key(room_code), self.rooms_key],
+                args=[room_code, time.time()],
+            )
+        )
+
+    def room_exists(self, room_code):
+        return bool(self.redis.exists(self._room_key(room_code)))
+
+    def room_count(self):
+        return self.redis.scard(self.rooms_key)
+
+    def add_member(self, room_code, delta=1):
+        return self._add_member(
+            keys=[self._room_key(room_code)], args=[delta, time.time()]
+        )
+
+    def member_count(self, room_code):
+        return int(self.redis.hget(self._room_key(room_code), "members") or 0)
+
+    def memory_estimates(self):
+        pipeline = self.redis.pipeline(transaction=False)
+        for room_code in self.redis.smembers(self.rooms_key):
+            pipeline.hget(self._room_key(room_code), "bytes")
+        return [int(size or 0) for size in pipeline.execute()]
+
+    def add_presence(self, room_code, sid, username):
+        self._add_presence(
+            keys=[self._room_key(room_code), self._room_key(room_code, "roster")],
+            args=[sid, username],
+        )
+
+    def remove_presence(self, room_code, sid):
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.hdel(self._room_key(room_code, "roster"), sid)
+        pipeline.zrem(self._room_key(room_code, "typing"), sid)
+        pipeline.execute()
+
+    def set_typing(self, room_code, sid, until):
+        typing_key = self._room_key(room_code, "typing")
+        if until is None:
+            self.redis.zrem(typing_key, sid)
+            return
+        self._set_typing(
+            keys=[self._room_key(room_code, "roster"), typing_key], args=[sid, until]
+        )
+
+    def presence(self, room_code, now):
+        typing_key = self._room_key(room_code, "typing")
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.exists(self._room_key(room_code))
+        pipeline.hgetall(self._room_key(room_code, "roster"))
+        pipeline.zremrangebyscore(typing_key, "-inf", now)
+        pipeline.zrange(typing_key, 0, -1, withscores=True)
+        exists, roster, _, typing = pipeline.execute()
+        if not exists:
+            return None
+        typing = {roster[sid]: until for sid, until in typing if sid in roster}
+        return sorted(set(roster.values())), typing
+
+    def append_message(self, room_code, message):
+        index = self._append_message(
+            keys=[self._room_key(room_code), self._room_key(room_code, "messages")],
+            args=[
+                json.dumps(message.to_record(), separators=(",", ":")),
+                time.time(),
+                self.max_messages,
+                self.max_bytes,
+            ],
+        )
+        if index is None:
+            return None
+        message.index = index
+        return message
+
+    def history_page(self, room_code, before=None, limit=50):
+        first_index, start, records = self._history_page(
+            keys=[self._room_key(room_code), self._room_key(room_code, "messages")],
+            args=["" if before is None else before, limit],
+        )
+        messages = [
+            Message.from_record(json.loads(record), first_index + offset)
+            for offset, record in enumerate(records)
+        ]
+        cursor = messages[0].index if messages and start > 0 else None
+        return messages, cursor
+
+    def add_image(self, room_code, blob_id):
+        self._add_image(
+            keys=[
+                self._room_key(room_code),
+                self._room_key(room_code, "images"),
+                self.image_refs_key,
+            ],
+            args=[blob_id],
+        )
+
+    def has_image(self, room_code, blob_id):
+        return bool(self.redis.sismember(self._room_key(room_code, "images"), blob_id))
+
+    def schedule_cleanup(self, room_code, deadline):
+        self._schedule_cleanup(
+            keys=[self._room_key(room_code), self.cleanup_key],
+            args=[room_code, deadline],
+        )
+
+    def cancel_cleanup(self, room_code):
+        return bool(
+            self._cancel_cleanup(
+                keys=[self._room_key(room_code), self.cleanup_key], args=[room_code]
+            )
+        )
+
+    def due_rooms(self, now):
+        return self.redis.zrangebyscore(self.cleanup_key, "-inf", now)
+
+    def expire_room(self, room_code, now):
+        return self._expire_room(
+            keys=[
+                self._room_key(room_code),
+                self._room_key(room_code, "messages"),
+                self._room_key(room_code, "images"),
+                self.rooms_key,
+                self.cleanup_key,
+                self.image_refs_key,
+                self._room_key(room_code, "roster"),
+                self._room_key(room_code, "typing"),
+            ],
+            args=[room_code, now],
+        )
+
+    def get_session(self, sid):
+        data = self.redis.get(f"{self.prefix}:session:{sid}")
+        return json.loads(data) if data is not None else None
+
+    def set_session(self, sid, data):
+        self.redis.set(
+            f"{self.prefix}:session:{sid}", json.dumps(data), ex=self.SESSION_TTL
+        )
+
+    def delete_session(self, sid):
+        self.redis.delete(f"{self.prefix}:session:{sid}")
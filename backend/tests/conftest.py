@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# Backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def chat_server(tmp_path, monkeypatch):
+    """Chat server recording its events instead of sending them"""
+    from server import Config
+    from fakes import FakeChatServer
+
+    monkeypatch.setattr(Config, "RATE_LIMITING", False)
+    monkeypatch.setattr(Config, "BLOB_STORAGE_DIR", str(tmp_path / "blobs"))
+    server = FakeChatServer()
+    yield server
+    server.drain()
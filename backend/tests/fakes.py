@@ -0,0 +1,43 @@
+from server import BaseChatServer
+
+
+class FakeChatServer(BaseChatServer):
+    """Chat server with an in-process transport that records every event"""
+
+    def __init__(self, *args, **kwargs):
+        self.sent = []
+        self.rooms = {}
+        self.backlogs = {}
+        super().__init__(*args, **kwargs)
+
+    def _transport_emit(self, event, data, to, skip):
+        for sid in sorted(self.rooms.get(to, {to}) - set(skip or ())):
+            self.sent.append((sid, event, data))
+
+    def _room_backlogs(self, room_code):
+        return {sid: self.backlogs.get(sid, 0) for sid in self.rooms.get(room_code, ())}
+
+    def _enter_room(self, sid, room_code):
+        self.rooms.setdefault(room_code, set()).add(sid)
+
+    def _leave_room(self, sid, room_code):
+        self.rooms.get(room_code, set()).discard(sid)
+
+    def _start_background_task(self, target, *args, **kwargs):
+        pass
+
+    def received(self, sid, event):
+        """Payloads of `event` sent to `sid`"""
+        return [data for to, name, data in self.sent if to == sid and name == event]
+
+
+def create_room(server):
+    """Create a room over the HTTP API, returns its code"""
+    response = server.app.test_client().post("/api/rooms", json={"username": "a"})
+    return response.get_json()["room_code"]
+
+
+def join(server, sid, room_code, username):
+    """Connect `sid` and join it to a room"""
+    server.handle_connect(sid)
+    server.handle_join(sid, {"room_code": room_code, "username": username})
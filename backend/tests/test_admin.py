@@ -0,0 +1,41 @@
+import pytest
+
+from server import Config
+
+
+@pytest.mark.parametrize("path", ["/api/serverinfo", "/api/metrics"])
+def test_admin_endpoints_check_the_client_address(chat_server, path):
+    client = chat_server.app.test_client()
+    remote = {"REMOTE_ADDR": "203.0.113.7"}
+
+    assert (
+        client.get(
+            path, headers={"Host": f"localhost:{Config.PORT}"}, environ_base=remote
+        ).status_code
+        == 403
+    )
+    assert (
+        client.get(path, environ_base={"REMOTE_ADDR": "127.0.0.1"}).status_code == 200
+    )
+
+
+def test_admin_token_is_required_when_set(chat_server, monkeypatch):
+    monkeypatch.setattr(Config, "METRICS_TOKEN", "secret")
+    client = chat_server.app.test_client()
+
+    assert client.get("/api/serverinfo").status_code == 401
+    response = client.get(
+        "/api/serverinfo",
+        headers={"Authorization": "Bearer secret"},
+        environ_base={"REMOTE_ADDR": "203.0.113.7"},
+    )
+    assert response.status_code == 200
+
+
+def test_metrics_include_queue_gauges(chat_server):
+    client = chat_server.app.test_client()
+    lines = client.get("/api/metrics").get_data(as_text=True).splitlines()
+
+    assert "whisperchat_history_spilled_bytes 0" in lines
+    assert "whisperchat_batched_messages 0" in lines
+    assert "whisperchat_pending_presence_rooms 0" in lines
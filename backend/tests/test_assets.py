@@ -0,0 +1,63 @@
+import gzip
+
+import pytest
+
+from flask import Flask
+from assets import StaticAssets
+
+STYLESHEET = "body { background: url('../img/logo.png'); }\n" * 40
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "css").mkdir()
+    (tmp_path / "img").mkdir()
+    (tmp_path / "img" / "logo.png").write_bytes(b"\x89PNG fake")
+    (tmp_path / "css" / "chat.css").write_text(STYLESHEET)
+    (tmp_path / "index.html").write_text(
+        '<link href="css/chat.css"><a href="#top">top</a>'
+    )
+
+    app = Flask(__name__)
+    assets = StaticAssets(str(tmp_path))
+    app.add_url_rule("/<path:path>", view_func=assets.serve)
+    app.assets = assets
+    return app.test_client()
+
+
+def test_references_point_at_hashed_names(client):
+    assets = client.application.assets
+    stylesheet = assets.hashed("css/chat.css")
+    logo = assets.hashed("img/logo.png")
+
+    page = client.get("/index.html").get_data(as_text=True)
+    assert stylesheet != "css/chat.css"
+    assert f'href="{stylesheet}"' in page
+    assert 'href="#top"' in page
+    assert logo.rsplit("/", 1)[1] in assets.assets[stylesheet].data.decode()
+
+
+def test_hashed_names_are_immutable_and_pages_revalidate(client):
+    hashed = client.get("/" + client.application.assets.hashed("css/chat.css"))
+    page = client.get("/index.html")
+
+    assert hashed.cache_control.immutable
+    assert hashed.cache_control.max_age == StaticAssets.CACHE_MAX_AGE
+    assert page.cache_control.no_cache
+    assert client.get("/missing.js").status_code == 404
+
+
+def test_compressed_variant_and_conditional_requests(client):
+    plain = client.get("/css/chat.css")
+    compressed = client.get("/css/chat.css", headers={"Accept-Encoding": "gzip"})
+
+    assert plain.content_encoding is None
+    assert compressed.content_encoding == "gzip"
+    assert "Accept-Encoding" in compressed.vary
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+
+    etag = compressed.headers["ETag"]
+    repeat = client.get(
+        "/css/chat.css", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+    assert repeat.status_code == 304
@@ -0,0 +1,71 @@
+import pytest
+
+from fakes import create_room, join
+from server import Config
+
+
+@pytest.fixture
+def room(chat_server, monkeypatch):
+    monkeypatch.setattr(Config, "OUTBOUND_HIGH_WATER", 5)
+    room_code = create_room(chat_server)
+    join(chat_server, "fast", room_code, "alice")
+    join(chat_server, "slow", room_code, "bob")
+    chat_server.sent.clear()
+    return room_code
+
+
+def say(server, *texts):
+    for text in texts:
+        server.handle_message("fast", {"message": text})
+
+
+def seqs(server, sid):
+    return [message["seq"] for message in server.received(sid, "new_message")]
+
+
+def test_lagging_member_is_held_back_until_it_syncs(chat_server, room):
+    say(chat_server, "m0")
+    chat_server.backlogs["slow"] = 5
+    say(chat_server, "m1", "m2")
+
+    assert seqs(chat_server, "fast") == [0, 1, 2]
+    assert seqs(chat_server, "slow") == [0]
+    assert len(chat_server.received("slow", "resync")) == 1
+
+    chat_server.backlogs["slow"] = 0
+    chat_server.handle_sync("slow", {"last_seen_seq": 0})
+    history = chat_server.received("slow", "message_history")
+    assert len(history) == 1 and history[0]["delta"]
+    assert [message["seq"] for message in history[0]["messages"]] == [1, 2]
+
+    say(chat_server, "m3")
+    assert seqs(chat_server, "slow") == [0, 3]
+
+
+def test_drained_member_resumes_without_syncing(chat_server, room):
+    chat_server.backlogs["slow"] = 5
+    say(chat_server, "m0", "m1")
+    chat_server.backlogs["slow"] = 3
+    say(chat_server, "m2")
+    assert "slow" in chat_server.throttled
+
+    chat_server.backlogs["slow"] = 2
+    say(chat_server, "m3")
+    history = chat_server.received("slow", "message_history")
+    assert [message["seq"] for message in history[0]["messages"]] == [0, 1, 2, 3]
+    assert seqs(chat_server, "slow") == []
+
+    say(chat_server, "m4")
+    assert seqs(chat_server, "slow") == [4]
+
+
+def test_sync_after_resuming_sends_nothing_twice(chat_server, room):
+    chat_server.backlogs["slow"] = 5
+    say(chat_server, "m0")
+    chat_server.backlogs["slow"] = 0
+    say(chat_server, "m1")
+    chat_server.handle_sync("slow", {"last_seen_seq": -1})
+
+    history = chat_server.received("slow", "message_history")
+    assert len(history) == 1
+    assert [message["seq"] for message in history[0]["messages"]] == [0, 1]
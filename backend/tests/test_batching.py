@@ -0,0 +1,57 @@
+import time
+import threading
+
+from batching import BroadcastBatcher
+
+
+def test_items_in_one_window_flush_together():
+    batcher = BroadcastBatcher(lambda room, items: None, window=10.0, max_batch=3)
+    batcher.add("A", 1)
+    batcher.add("A", 2)
+    batcher.add("B", 3)
+
+    assert batcher.pending == 3
+    assert batcher.pop_due(time.monotonic()) == []
+
+    batcher.add("A", 4)
+    assert batcher.pop_due(time.monotonic()) == [("A", [1, 2, 4])]
+    assert batcher.pop_due(time.monotonic() + 10.0) == [("B", [3])]
+    assert batcher.pending == 0
+
+
+def test_run_flushes_batches_in_order_and_stop_drains():
+    flushed = []
+    batcher = BroadcastBatcher(
+        lambda room, items: flushed.append((room, items)), window=0.01, max_batch=5
+    )
+    thread = threading.Thread(target=batcher.run, daemon=True)
+    thread.start()
+
+    for item in range(12):
+        batcher.add("A", item)
+    time.sleep(0.1)
+    batcher.add("B", "late")
+    batcher.stop()
+    thread.join(timeout=1.0)
+
+    assert not thread.is_alive()
+    assert [item for room, items in flushed if room == "A" for item in items] == list(
+        range(12)
+    )
+    assert all(len(items) <= 5 for _, items in flushed)
+    assert flushed[-1] == ("B", ["late"])
+
+
+def test_failed_flush_does_not_stop_batching():
+    calls = []
+
+    def flush(room, items):
+        calls.append(room)
+        raise RuntimeError("emit failed")
+
+    batcher = BroadcastBatcher(flush, window=10.0)
+    batcher.add("A", 1)
+    batcher.add("B", 2)
+    batcher.stop()
+
+    assert sorted(calls) == ["A", "B"]
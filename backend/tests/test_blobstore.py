@@ -0,0 +1,88 @@
+import os
+
+from io import BytesIO
+
+import pytest
+
+from PIL import Image
+from blobstore import BlobError, BlobStore
+
+
+def image_bytes(color="red", image_format="PNG"):
+    output = BytesIO()
+    Image.new("RGB", (4, 4), color).save(output, image_format)
+    return output.getvalue()
+
+
+@pytest.fixture
+def blobs(tmp_path):
+    return BlobStore(root=str(tmp_path), max_size=1024, allowed_formats=["PNG"])
+
+
+def test_identical_uploads_share_one_blob(blobs):
+    first, size = blobs.put_bytes(image_bytes())
+    second, _ = blobs.put_bytes(image_bytes())
+
+    assert first == second
+    assert first.endswith(".png")
+    assert size == len(image_bytes())
+    assert blobs.exists(first)
+    assert blobs.put_bytes(image_bytes("blue"))[0] != first
+
+
+def test_rejects_unsupported_uploads(blobs):
+    with pytest.raises(BlobError) as error:
+        blobs.put_bytes(b"not an image")
+    assert error.value.status == 400
+
+    with pytest.raises(BlobError):
+        blobs.put_bytes(image_bytes(image_format="GIF"))
+
+    with pytest.raises(BlobError) as error:
+        blobs.put_bytes(b"\x89PNG" + b"\0" * 2048)
+    assert error.value.status == 413
+
+    assert not [name for name in os.listdir(blobs.root) if name.endswith(".part")]
+
+
+def test_blob_ids_are_validated(blobs):
+    assert not blobs.exists("../../etc/passwd")
+    assert not blobs.exists("a" * 64 + ".exe")
+    assert not blobs.exists("a" * 64 + ".png")
+
+
+def test_delete_removes_blob(blobs):
+    blob_id, _ = blobs.put_bytes(image_bytes())
+
+    blobs.delete(blob_id)
+    assert not blobs.exists(blob_id)
+    blobs.delete(blob_id)
+    blobs.delete("../../etc/passwd")
+
+
+def test_staged_upload_is_committed_or_discarded(blobs):
+    tmp_path, size, digest, image_format = blobs.stage_stream(BytesIO(image_bytes()))
+    assert os.path.exists(tmp_path)
+    assert image_format == "PNG"
+
+    blob_id = blobs.commit(tmp_path, digest, image_format)
+    assert blob_id == f"{digest}.png"
+    assert blobs.exists(blob_id)
+    assert not os.path.exists(tmp_path)
+
+    tmp_path, *_ = blobs.stage_stream(BytesIO(image_bytes("blue")))
+    blobs.discard(tmp_path)
+    blobs.discard(tmp_path)
+    assert not os.path.exists(tmp_path)
+
+
+def test_close_removes_only_a_temporary_root(tmp_path):
+    temporary = BlobStore(allowed_formats=["PNG"])
+    temporary.put_bytes(image_bytes())
+    temporary.close()
+    assert not os.path.exists(temporary.root)
+
+    store = BlobStore(root=str(tmp_path), allowed_formats=["PNG"])
+    store.put_bytes(image_bytes())
+    store.close()
+    assert os.listdir(tmp_path)
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from engine import ChatEngine
+from store import MemoryRoomStore
+
+
+def create_engine(**kwargs):
+    return ChatEngine(MemoryRoomStore(10, 10**6), page_size=5, **kwargs)
+
+
+def test_last_member_leaving_schedules_cleanup():
+    engine = create_engine()
+    room_code = engine.create()
+
+    assert len(room_code) == 7 and engine.exists(room_code)
+    assert engine.scheduler.pending == 1
+    assert engine.join(room_code) == 1
+    assert engine.scheduler.pending == 0
+    assert engine.leave(room_code) == 0
+    assert engine.scheduler.pending == 1
+    assert engine.join(room_code) == 1
+    assert engine.scheduler.pending == 0
+    assert engine.join("MISSING") is None
+
+
+def test_expired_room_reports_orphaned_images():
+    expired = []
+    engine = create_engine(
+        cleanup_delay=0.01, on_expire=lambda *args: expired.append(args)
+    )
+    room_code = engine.create()
+    engine.join(room_code)
+    engine.store.add_image(room_code, "blob")
+    engine.leave(room_code)
+
+    assert engine.expire(room_code) is None
+    time.sleep(0.02)
+    assert engine.expire(room_code) == ["blob"]
+    assert expired == [(room_code, ["blob"])]
+    assert not engine.exists(room_code)
+
+
+def test_posts_are_paged_by_page_size():
+    engine = create_engine()
+    room_code = engine.create()
+    for index in range(8):
+        assert engine.post(room_code, "alice", f"m{index}").message == f"m{index}"
+
+    messages, cursor = engine.history(room_code, limit=100)
+    assert [message.message for message in messages] == ["m3", "m4", "m5", "m6", "m7"]
+    messages, _ = engine.history(room_code, before=cursor)
+    assert [message.message for message in messages] == ["m0", "m1", "m2"]
+    assert engine.post("MISSING", "alice", "lost") is None
+
+
+@pytest.mark.parametrize("last_seen_seq", [None, True, "3", 1.0])
+def test_history_since_needs_an_integer(last_seen_seq):
+    engine = create_engine()
+    room_code = engine.create()
+    engine.post(room_code, "alice", "m0")
+
+    assert engine.history_since(room_code, last_seen_seq) is None
+
+
+def test_accept_code_skips_rejected_codes():
+    rejected = []
+
+    def accept(room_code):
+        if len(rejected) < 3:
+            rejected.append(room_code)
+            return False
+        return True
+
+    engine = create_engine(accept_code=accept)
+    room_code = engine.create()
+    assert len(rejected) == 3 and room_code not in rejected
+
+
+def test_restored_rooms_are_scheduled_for_cleanup():
+    source = create_engine()
+    room_codes = {source.create() for _ in range(3)}
+    source.post(next(iter(room_codes)), "alice", "kept")
+
+    engine = create_engine()
+    assert engine.restore(source.store.snapshot()) == 3
+    assert engine.scheduler.pending == 3
+    assert all(engine.exists(room_code) for room_code in room_codes)
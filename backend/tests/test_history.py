@@ -0,0 +1,110 @@
+import os
+import random
+
+import pytest
+
+from history import Message, MessageHistory
+
+
+def make_message(index):
+    return Message(str(index), "user", "m" * (index % 7), index)
+
+
+def page_all(history, limit):
+    """Walk every page from the newest, returns indexes oldest first"""
+    indexes, cursor = [], None
+    while True:
+        messages, cursor = history.page(cursor, limit)
+        indexes = [message.index for message in messages] + indexes
+        if cursor is None:
+            return indexes
+
+
+def test_ring_buffer_keeps_newest_messages():
+    history = MessageHistory(10, 10**6)
+    for index in range(25):
+        history.append(make_message(index))
+
+    assert len(history) == 10
+    assert history.first_index == 15
+    assert page_all(history, 3) == list(range(15, 25))
+
+
+def test_ring_buffer_byte_cap_keeps_latest_message():
+    history = MessageHistory(10, 1)
+    for index in range(5):
+        history.append(make_message(index))
+
+    assert [message.index for message in history.messages] == [4]
+
+
+def test_pages_walk_back_from_cursor():
+    history = MessageHistory(100, 10**6)
+    for index in range(30):
+        history.append(make_message(index))
+
+    messages, cursor = history.page(None, 10)
+    assert [message.index for message in messages] == list(range(20, 30))
+    assert cursor == 20
+
+    messages, cursor = history.page(cursor, 15)
+    assert [message.index for message in messages] == list(range(5, 20))
+    assert cursor == 5
+
+    messages, cursor = history.page(cursor, 15)
+    assert [message.index for message in messages] == list(range(5))
+    assert cursor is None
+
+
+def test_spilled_pages_match_ring_buffer(tmp_path):
+    pytest.importorskip("cryptography")
+    from spill import SpillingHistory
+
+    rng = random.Random(1234)
+    for _ in range(30):
+        max_messages = rng.randint(1, 60)
+        plain = MessageHistory(max_messages, 10**9)
+        spilled = SpillingHistory(
+            max_messages,
+            10**9,
+            str(tmp_path),
+            hot_messages=rng.randint(1, 20),
+            segment_messages=rng.randint(1, 7),
+        )
+        for index in range(rng.randint(0, 200)):
+            plain.append(make_message(index))
+            spilled.append(make_message(index))
+            before = rng.choice([None, rng.randint(-5, 250)])
+            limit = rng.randint(1, 30)
+
+            expected, expected_cursor = plain.page(before, limit)
+            messages, cursor = spilled.page(before, limit)
+            assert [m.index for m in messages] == [m.index for m in expected]
+            assert [m.id for m in messages] == [m.id for m in expected]
+            assert cursor == expected_cursor
+
+        spilled.close()
+        assert os.listdir(tmp_path) == []
+
+
+def test_failed_spill_keeps_message(tmp_path, monkeypatch):
+    pytest.importorskip("cryptography")
+    import spill
+
+    history = spill.SpillingHistory(100, 10**9, str(tmp_path), hot_messages=10)
+    for index in range(30):
+        history.append(make_message(index))
+
+    def failing_pwrite(fd, data, offset):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(spill.os, "pwrite", failing_pwrite)
+    for index in range(30, 35):
+        history.append(make_message(index))
+    assert len(history) == 15
+
+    monkeypatch.undo()
+    history.append(make_message(35))
+    assert len(history) == 10
+    assert page_all(history, 7) == list(range(36))
+    history.close()
@@ -0,0 +1,48 @@
+from imagecache import ImageCache
+
+
+def test_least_recently_used_blobs_are_evicted():
+    cache = ImageCache(400)
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    cache.put("c", b"c" * 100)
+    cache.get("a")
+    cache.put("d", b"d" * 100)
+    cache.put("e", b"e" * 100)
+
+    assert cache.get("b") is None
+    assert [cache.get(blob_id) is not None for blob_id in "acde"] == [True] * 4
+    assert cache.size == 400
+
+
+def test_large_blobs_are_not_cached():
+    cache = ImageCache(400)
+    cache.put("big", b"x" * 101)
+    cache.put("small", b"x" * 100)
+
+    assert cache.get("big") is None
+    assert cache.size == 100
+
+
+def test_releasing_a_blob_forgets_its_sources():
+    cache = ImageCache(400)
+    cache.put("image", b"i" * 10)
+    cache.remember("digest", ("image", "thumb"))
+    cache.remember("other", ("image", "thumb2"))
+    assert cache.lookup("digest") == ("image", "thumb")
+
+    cache.release("thumb")
+    assert cache.lookup("digest") is None
+    assert cache.lookup("other") == ("image", "thumb2")
+
+    cache.release("image")
+    assert cache.lookup("other") is None
+    assert cache.get("image") is None
+    assert cache.size == 0
+
+
+def test_fits_matches_what_put_keeps():
+    cache = ImageCache(400)
+
+    assert cache.fits(100)
+    assert not cache.fits(101)
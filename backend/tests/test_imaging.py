@@ -0,0 +1,66 @@
+from io import BytesIO
+from concurrent.futures import Future
+
+import pytest
+
+from PIL import Image
+from blobstore import BlobStore
+from imagecache import ImageCache
+from imaging import ImagePipeline, transcode_image
+
+
+@pytest.fixture
+def blobs(tmp_path):
+    return BlobStore(root=str(tmp_path), allowed_formats=["PNG", "WEBP"])
+
+
+def animated_png(tmp_path):
+    exif = Image.Exif()
+    exif[0x010F] = "SecretCam"
+    frames = [Image.new("RGB", (40, 30), color) for color in ("red", "blue")]
+    path = tmp_path / "animated.png"
+    frames[0].save(
+        path,
+        "PNG",
+        save_all=True,
+        append_images=frames[1:],
+        duration=[100, 300],
+        exif=exif,
+    )
+    return str(path)
+
+
+def test_animated_images_are_reencoded_without_metadata(blobs, tmp_path):
+    image_id, thumbnail_id, _ = transcode_image(
+        blobs, animated_png(tmp_path), 2048, 320, 85
+    )
+
+    with open(blobs.path(image_id), "rb") as f:
+        data = f.read()
+    assert image_id.endswith(".webp") and thumbnail_id.endswith(".webp")
+    assert b"SecretCam" not in data
+    with Image.open(BytesIO(data)) as image:
+        assert image.n_frames == 2
+        image.seek(1)
+        image.load()
+        assert image.info["duration"] == 300
+
+
+def test_late_transcode_keeps_only_blobs_in_use(blobs, tmp_path):
+    cache = ImageCache(2**20)
+    pipeline = ImagePipeline(blobs, queue_size=1, cache=cache)
+    image_id, thumbnail_id, _ = transcode_image(
+        blobs, animated_png(tmp_path), 2048, 320, 85
+    )
+    cache.remember("other", (image_id, "elsewhere"))
+
+    assert pipeline.slots.acquire(blocking=False)
+    future = Future()
+    future.set_result((image_id, thumbnail_id, {}))
+    pipeline._finish_late(future, str(tmp_path / "staged.part"))
+    pipeline.shutdown()
+
+    assert blobs.exists(image_id)
+    assert not blobs.exists(thumbnail_id)
+    assert cache.lookup("other") == (image_id, "elsewhere")
+    assert pipeline.slots.acquire(blocking=False)
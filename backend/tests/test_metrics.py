@@ -0,0 +1,47 @@
+from metrics import MetricsRegistry, payload_size
+
+
+def test_counters_and_gauges_render_in_text_format():
+    registry = MetricsRegistry(prefix="test")
+    events = registry.counter("events_total", "Events", ["event"])
+    registry.gauge("rooms", "Rooms", lambda: 3)
+    events.inc("join")
+    events.inc("join")
+    events.inc('say "hi"\n', amount=5)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE test_events_total counter" in lines
+    assert 'test_events_total{event="join"} 2' in lines
+    assert 'test_events_total{event="say \\"hi\\"\\n"} 5' in lines
+    assert "test_rooms 3" in lines
+    assert events.value("join") == 2
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry(prefix="test")
+    latency = registry.histogram("latency", "Latency", (0.1, 1.0), ["event"])
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, "join")
+
+    lines = registry.render().splitlines()
+    assert 'test_latency_bucket{event="join",le="0.1"} 1' in lines
+    assert 'test_latency_bucket{event="join",le="1.0"} 2' in lines
+    assert 'test_latency_bucket{event="join",le="+Inf"} 3' in lines
+    assert 'test_latency_count{event="join"} 3' in lines
+    assert 'test_latency_sum{event="join"} 5.55' in lines
+
+
+def test_sampled_histogram_is_rebuilt_on_each_scrape():
+    registry = MetricsRegistry(prefix="test")
+    values = [1, 2]
+    registry.sampled_histogram("sizes", "Sizes", (1, 10), lambda: values)
+    registry.render()
+    values.append(20)
+
+    assert "test_sizes_count 3" in registry.render().splitlines()
+
+
+def test_payload_size_counts_nested_values():
+    assert payload_size("abc") == 3
+    assert payload_size({"ab": "cd", "n": 1}) == 2 + 2 + 1 + 8
+    assert payload_size([b"xy", ["z"]]) == 3
@@ -0,0 +1,50 @@
+import time
+
+from fakes import create_room, join
+from presence import PresenceThrottle
+
+
+def test_marks_coalesce_into_one_snapshot_per_room():
+    throttle = PresenceThrottle(lambda room: None, interval=1.0)
+    for _ in range(50):
+        throttle.mark("ROOM", at=100.0)
+    throttle.mark("OTHER", at=100.5)
+
+    assert throttle.pop_due(100.0) == ["ROOM"]
+    assert throttle.pop_due(100.0) == []
+    assert throttle.pop_due(101.0) == ["OTHER"]
+
+
+def test_earlier_mark_wins():
+    throttle = PresenceThrottle(lambda room: None)
+    throttle.mark("ROOM", at=105.0)
+    throttle.mark("ROOM", at=102.0)
+    throttle.mark("ROOM", at=108.0)
+
+    assert throttle.pop_due(101.0) == []
+    assert throttle.pop_due(102.0) == ["ROOM"]
+
+
+def test_typing_events_refresh_the_store_once_per_interval(chat_server, monkeypatch):
+    room_code = create_room(chat_server)
+    join(chat_server, "sid", room_code, "alice")
+    chat_server.presence.pop_due(float("inf"))
+
+    calls = []
+    set_typing = chat_server.store.set_typing
+    monkeypatch.setattr(
+        chat_server.store,
+        "set_typing",
+        lambda *args: calls.append(args) or set_typing(*args),
+    )
+    for _ in range(50):
+        chat_server.handle_typing("sid", {"typing": True})
+
+    assert len(calls) == 1
+    assert chat_server.presence.pop_due(float("inf")) == [room_code]
+    _, typing = chat_server.store.presence(room_code, time.time())
+    assert list(typing) == ["alice"]
+
+    chat_server.handle_typing("sid", {"typing": False})
+    assert len(calls) == 2
+    assert chat_server.presence.pop_due(float("inf")) == [room_code]
@@ -0,0 +1,31 @@
+import threading
+
+from profiling import SamplingProfiler
+
+
+def wait_for_profile(event):
+    event.wait()
+
+
+def test_profile_folds_stacks_of_other_threads():
+    event = threading.Event()
+    thread = threading.Thread(target=wait_for_profile, args=(event,), name="waiter")
+    thread.start()
+    try:
+        report = SamplingProfiler(interval=0.001).profile(0.05)
+    finally:
+        event.set()
+        thread.join()
+
+    stacks = dict(line.rsplit(" ", 1) for line in report.splitlines())
+    waiting = [stack for stack in stacks if stack.startswith("waiter;")]
+    assert waiting and "wait_for_profile (test_profiling.py" in waiting[0]
+    assert all(int(count) > 0 for count in stacks.values())
+    assert "test_profile_folds_stacks_of_other_threads" not in report
+
+
+def test_only_one_profile_runs_at_a_time():
+    profiler = SamplingProfiler()
+    with profiler.lock:
+        assert profiler.profile(0.01) is None
+    assert profiler.profile(0.01) is not None
@@ -0,0 +1,52 @@
+import pytest
+
+import ratelimit
+
+from ratelimit import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_then_refill(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+
+    assert [limiter.allow("a") for _ in range(4)] == [True, True, True, False]
+    clock[0] += 0.5
+    assert limiter.allow("a")
+    assert not limiter.allow("a")
+
+    clock[0] += 100
+    assert [limiter.allow("a") for _ in range(4)] == [True, True, True, False]
+
+
+def test_keys_have_their_own_buckets(clock):
+    limiter = RateLimiter(rate=1, burst=1)
+
+    assert limiter.allow("a")
+    assert not limiter.allow("a")
+    assert limiter.allow("b")
+
+    limiter.forget("a")
+    assert limiter.allow("a")
+
+
+def test_cost_is_capped_at_burst(clock):
+    limiter = RateLimiter(rate=1, burst=10)
+
+    assert limiter.allow("a", cost=100)
+    assert not limiter.allow("a", cost=1)
+
+
+def test_full_buckets_are_pruned(clock):
+    limiter = RateLimiter(rate=1, burst=2, max_keys=2)
+    limiter.allow("a")
+    limiter.allow("b")
+
+    clock[0] += 10
+    limiter.allow("c")
+    assert set(limiter.buckets) == {"c"}
@@ -0,0 +1,18 @@
+from roomcodes import RoomCodeAllocator
+
+
+def test_codes_do_not_repeat_until_space_is_exhausted():
+    allocator = RoomCodeAllocator(2, alphabet="ABCDEFG")
+    codes = [allocator.allocate() for _ in range(allocator.capacity)]
+
+    assert len(set(codes)) == allocator.capacity == 49
+    assert all(len(code) == 2 and set(code) <= set("ABCDEFG") for code in codes)
+    assert allocator.allocate() == codes[0]
+
+
+def test_consecutive_codes_are_not_sequential():
+    allocator = RoomCodeAllocator(7)
+    codes = [allocator.allocate() for _ in range(100)]
+
+    assert len(set(codes)) == 100
+    assert sum(a[1:] == b[1:] for a, b in zip(codes, codes[1:])) < 10
@@ -0,0 +1,54 @@
+from scheduler import CleanupScheduler
+
+
+def test_due_keys_come_out_in_deadline_order():
+    scheduler = CleanupScheduler(lambda key: None)
+    scheduler.schedule("b", 20.0)
+    scheduler.schedule("a", 10.0)
+    scheduler.schedule("c", 30.0)
+
+    assert scheduler.pop_due(5.0) == []
+    assert scheduler.pop_due(25.0) == ["a", "b"]
+    assert scheduler.pending == 1
+
+
+def test_reschedule_replaces_and_cancel_drops_deadline():
+    scheduler = CleanupScheduler(lambda key: None)
+    scheduler.schedule("a", 10.0)
+    scheduler.schedule("a", 50.0)
+    scheduler.schedule("b", 10.0)
+
+    assert scheduler.cancel("b")
+    assert not scheduler.cancel("b")
+    assert scheduler.pop_due(20.0) == []
+    assert scheduler.pop_due(50.0) == ["a"]
+    assert scheduler.pending == 0
+
+
+def test_stale_entries_are_compacted():
+    scheduler = CleanupScheduler(lambda key: None)
+    for deadline in range(200):
+        scheduler.schedule("a", float(deadline))
+
+    scheduler.pop_due(-1.0)
+    assert len(scheduler.heap) <= 2 * scheduler.pending + 64
+
+
+def test_run_expires_local_and_reconciled_keys():
+    expired = []
+
+    def callback(key):
+        expired.append(key)
+        if key == "a":
+            raise RuntimeError("cleanup failed")
+
+    scheduler = CleanupScheduler(
+        callback,
+        interval=0,
+        reconcile=lambda now: ["remote", "a"],
+        reconcile_interval=0,
+    )
+    scheduler.schedule("a", 0.0)
+    scheduler.run(sleep=lambda seconds: scheduler.stop())
+
+    assert expired == ["a", "remote"]
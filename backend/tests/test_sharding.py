@@ -0,0 +1,51 @@
+from collections import Counter
+
+from router import ShardRouter
+from sharding import HashRing
+
+KEYS = [f"ROOM{index}" for index in range(4000)]
+
+
+def test_ring_spreads_keys_over_nodes():
+    ring = HashRing(range(4))
+    owners = Counter(ring.node_for(key) for key in KEYS)
+
+    assert set(owners) == {0, 1, 2, 3}
+    assert all(600 < count < 1400 for count in owners.values())
+    assert all(HashRing(range(4)).node_for(key) == ring.node_for(key) for key in KEYS)
+
+
+def test_adding_a_node_moves_few_keys():
+    before = HashRing(range(4))
+    after = HashRing(range(5))
+    moved = [key for key in KEYS if before.node_for(key) != after.node_for(key)]
+
+    assert all(after.node_for(key) == 4 for key in moved)
+    assert len(moved) < len(KEYS) * 0.35
+
+
+def test_router_keeps_a_room_on_one_worker():
+    router = ShardRouter([8001, 8002, 8003])
+    worker = router.route("/api/rooms/ABC1234/exists")
+
+    assert router.route("/api/rooms/ABC1234/images") == worker
+    assert router.route("/socket.io/?EIO=4&transport=polling&room=ABC1234") == worker
+    assert [router.route("/index.html") for _ in range(3)] == [0, 1, 2]
+
+
+def test_router_closes_plain_requests_and_keeps_upgrades():
+    router = ShardRouter([8001])
+    plain = router._rewrite_head(
+        b"GET / HTTP/1.1\r\nConnection: keep-alive\r\nX-Forwarded-For: 1.2.3.4\r\n\r\n",
+        "10.0.0.1",
+    )
+    upgrade = router._rewrite_head(
+        b"GET /socket.io/ HTTP/1.1\r\nConnection: Upgrade\r\nUpgrade: websocket\r\n\r\n",
+        "10.0.0.1",
+    )
+
+    assert plain == (
+        b"GET / HTTP/1.1\r\nConnection: close\r\nX-Forwarded-For: 10.0.0.1\r\n\r\n"
+    )
+    assert b"Connection: Upgrade" in upgrade
+    assert b"Connection: close" not in upgrade
@@ -0,0 +1,124 @@
+import pytest
+
+from history import Message
+from store import MemoryRoomStore
+
+
+def fill(store, room_code, count):
+    for index in range(count):
+        store.append_message(room_code, Message(str(index), "user", f"m{index}", index))
+
+
+def indexes(messages):
+    return [message.index for message in messages]
+
+
+def test_room_expires_after_deadline_without_members():
+    store = MemoryRoomStore(10, 10**6)
+    assert store.create_room("ROOM")
+    assert not store.create_room("ROOM")
+
+    store.add_member("ROOM")
+    store.schedule_cleanup("ROOM", 100.0)
+    assert store.expire_room("ROOM", 200.0) is None
+
+    store.remove_member("ROOM")
+    assert store.due_rooms(99.0) == []
+    assert store.due_rooms(100.0) == ["ROOM"]
+    assert store.expire_room("ROOM", 99.0) is None
+    assert store.expire_room("ROOM", 100.0) == []
+    assert not store.room_exists("ROOM")
+    assert store.add_member("ROOM") is None
+
+
+def test_cancelled_cleanup_keeps_room():
+    store = MemoryRoomStore(10, 10**6)
+    store.create_room("ROOM")
+    store.schedule_cleanup("ROOM", 100.0)
+
+    assert store.cancel_cleanup("ROOM")
+    assert not store.cancel_cleanup("ROOM")
+    assert store.expire_room("ROOM", 200.0) is None
+    assert store.room_exists("ROOM")
+
+
+def test_shared_image_is_orphaned_by_last_room():
+    store = MemoryRoomStore(10, 10**6)
+    for room_code in ("A", "B"):
+        store.create_room(room_code)
+        store.add_image(room_code, "shared.webp")
+        store.schedule_cleanup(room_code, 100.0)
+    store.add_image("B", "own.webp")
+
+    assert store.expire_room("A", 100.0) == []
+    assert sorted(store.expire_room("B", 100.0)) == ["own.webp", "shared.webp"]
+
+
+@pytest.fixture
+def store():
+    store = MemoryRoomStore(10, 10**6)
+    store.create_room("ROOM")
+    fill(store, "ROOM", 25)
+    return store
+
+
+def test_history_since_returns_missed_messages(store):
+    assert indexes(store.history_since("ROOM", 20)) == [21, 22, 23, 24]
+    assert store.history_since("ROOM", 24) == []
+
+
+def test_history_since_from_oldest_retained(store):
+    assert indexes(store.history_since("ROOM", 14)) == list(range(15, 25))
+
+
+def test_history_since_needs_resend(store):
+    # Evicted messages, too many missed ones, or a client ahead of the room
+    assert store.history_since("ROOM", 13) is None
+    assert store.history_since("ROOM", 14, limit=9) is None
+    assert store.history_since("ROOM", 30) is None
+    assert indexes(store.history_since("ROOM", 15, limit=9)) == list(range(16, 25))
+
+
+def round_trip(store):
+    store.add_image("ROOM", "blob.webp")
+    store.schedule_cleanup("ROOM", 1234.0)
+    state = store.snapshot()
+
+    restored = MemoryRoomStore(10, 10**6, spill_dir=store.spill_dir)
+    deadlines = restored.restore(state, cleanup_at=9999.0)
+    return restored, deadlines
+
+
+def test_snapshot_round_trip(store):
+    restored, deadlines = round_trip(store)
+
+    assert deadlines == {"ROOM": 1234.0}
+    assert restored.has_image("ROOM", "blob.webp")
+    messages, cursor = restored.history_page("ROOM", None, 50)
+    assert indexes(messages) == list(range(15, 25))
+    assert [message.message for message in messages] == [
+        f"m{index}" for index in range(15, 25)
+    ]
+    assert cursor is None
+    assert indexes(restored.history_since("ROOM", 20)) == [21, 22, 23, 24]
+
+    fill(restored, "ROOM", 1)
+    assert restored.history_page("ROOM", None, 1)[0][0].index == 25
+
+
+def test_snapshot_closes_rooms(store):
+    store.snapshot()
+    assert store.append_message("ROOM", Message("x", "user", "late", 0)) is None
+
+
+def test_spilled_snapshot_round_trip(tmp_path):
+    pytest.importorskip("cryptography")
+    store = MemoryRoomStore(10, 10**6, spill_dir=str(tmp_path), hot_messages=3)
+    store.create_room("ROOM")
+    fill(store, "ROOM", 25)
+    assert store.spilled_bytes() > 0
+
+    restored, _ = round_trip(store)
+    messages, _ = restored.history_page("ROOM", None, 50)
+    assert indexes(messages) == list(range(15, 25))
+    assert indexes(restored.history_since("ROOM", 20)) == [21, 22, 23, 24]
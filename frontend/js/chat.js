@@ -1,9 +1,12 @@
 let CONFIG = {};
 
+const MSGPACK_PARSER_URL =
+  "https://cdn.jsdelivr.net/npm/socket.io-msgpack-parser@3.0.2/+esm";
+
 class ChatRoom {
   constructor() {
-    this.loadConfig().then(() => {
-      this.socket = io(CONFIG.BACKEND_URL);
+    this.loadConfig().then(async () => {
+      this.socket = await this.connect();
       this.roomCode = null;
       this.username = null;
       this.lastSender = null;
@@ -22,6 +25,10 @@ class ChatRoom {
       };
       this.currentImageIndex = 0;
       this.currentImageSet = [];
+      this.historyCursor = null;
+      this.isLoadingHistory = false;
+      this.lastSeq = null;
+      this.lastTypingSent = 0;
       this.init();
     });
   }
@@ -31,6 +38,24 @@ class ChatRoom {
     CONFIG = await response.json();
   }
 
+  async connect() {
+    // The sharding router sends each room to the worker that owns it
+    const options = { query: { room: this.storedRoomCode() } };
+    try {
+      const response = await fetch(`${CONFIG.BACKEND_URL}/api/transport`);
+      const transport = await response.json();
+      if (transport.wire_format === "msgpack") {
+        const parser = await import(
+          CONFIG.MSGPACK_PARSER_URL || MSGPACK_PARSER_URL
+        );
+        options.parser = parser.default || parser;
+      }
+    } catch (error) {
+      console.warn("Falling back to the JSON wire format", error);
+    }
+    return io(CONFIG.BACKEND_URL, options);
+  }
+
   init() {
     this.loadUserData();
     this.setupParticles();
@@ -41,11 +66,16 @@ class ChatRoom {
     this.joinRoom();
   }
 
+  storedRoomCode() {
+    return (
+      new URLSearchParams(window.location.search).get("room") ||
+      localStorage.getItem("roomCode")
+    );
+  }
+
   loadUserData() {
     this.username = localStorage.getItem("username");
-    this.roomCode =
-      new URLSearchParams(window.location.search).get("room") ||
-      localStorage.getItem("roomCode");
+    this.roomCode = this.storedRoomCode();
 
     if (!this.username || !this.roomCode) {
       window.location.href = "index.html";
@@ -55,6 +85,13 @@ class ChatRoom {
     document.getElementById("room-code-display").textContent = this.roomCode;
   }
 
+  loadOlderMessages() {
+    if (this.historyCursor == null || this.isLoadingHistory) return;
+
+    this.isLoadingHistory = true;
+    this.socket.emit("fetch_history", { before: this.historyCursor });
+  }
+
   setupParticles() {
     if (typeof particlesJS !== "undefined" && window.innerWidth > 672) {
       particlesJS("particles-js", {
@@ -191,6 +228,13 @@ class ChatRoom {
       this.handleResize();
     });
 
+    const messagesContainer = document.getElementById("messages-container");
+    messagesContainer.addEventListener("scroll", () => {
+      if (messagesContainer.scrollTop < 80) {
+        this.loadOlderMessages();
+      }
+    });
+
     window.addEventListener("beforeunload", () => {
       this.leaveRoom();
     });
@@ -509,6 +553,7 @@ class ChatRoom {
     const sendIcon = document.getElementById("send-icon");
 
     const hasText = messageInput.value.trim().length > 0;
+    this.updateTyping(hasText);
 
     if (hasText && !this.isSendMode) {
       this.isSendMode = true;
@@ -525,6 +570,34 @@ class ChatRoom {
     }
   }
 
+  updateTyping(isTyping) {
+    const now = Date.now();
+    if (isTyping && now - this.lastTypingSent > 2000) {
+      this.lastTypingSent = now;
+      this.socket.emit("typing", { typing: true });
+    } else if (!isTyping && this.lastTypingSent) {
+      this.lastTypingSent = 0;
+      this.socket.emit("typing", { typing: false });
+    }
+  }
+
+  displayPresence(data) {
+    const count = data.members.length;
+    document.getElementById("member-count").textContent = `${count} online`;
+
+    const typing = data.typing.filter((name) => name !== this.username);
+    const indicator = document.getElementById("typing-indicator");
+    if (typing.length === 0) {
+      indicator.textContent = "";
+    } else if (typing.length === 1) {
+      indicator.textContent = `${typing[0]} is typing...`;
+    } else if (typing.length <= 3) {
+      indicator.textContent = `${typing.join(", ")} are typing...`;
+    } else {
+      indicator.textContent = `${typing.length} people are typing...`;
+    }
+  }
+
   handleActionButton() {
     if (this.isSendMode) {
       this.sendMessage();
@@ -545,6 +618,10 @@ class ChatRoom {
 
     this.socket.on("disconnect", (reason) => {});
 
+    this.socket.io.on("reconnect", () => {
+      this.joinRoom();
+    });
+
     this.socket.on("connect_error", (error) => {
       this.showCustomToast("Failed to connect to chat server", "error");
     });
@@ -554,13 +631,38 @@ class ChatRoom {
     });
 
     this.socket.on("message_history", (data) => {
+      if (!data.delta) {
+        document.getElementById("messages-container").innerHTML = "";
+        this.lastSender = null;
+        this.historyCursor = data.cursor;
+        this.lastSeq = null;
+      }
       data.messages.forEach((msg) => this.displayMessage(msg));
     });
 
+    this.socket.on("resync", () => {
+      // The server held back messages while this connection lagged
+      this.socket.emit("sync", { last_seen_seq: this.lastSeq });
+    });
+
+    this.socket.on("history_page", (data) => {
+      this.prependHistory(data.messages);
+      this.historyCursor = data.cursor;
+      this.isLoadingHistory = false;
+    });
+
     this.socket.on("new_message", (data) => {
       this.displayMessage(data);
     });
 
+    this.socket.on("new_messages", (data) => {
+      data.messages.forEach((msg) => this.displayMessage(msg));
+    });
+
+    this.socket.on("presence", (data) => {
+      this.displayPresence(data);
+    });
+
     this.socket.on("user_joined", (data) => {
       this.displaySystemMessage(`${data.username} joined the room`);
     });
@@ -571,10 +673,14 @@ class ChatRoom {
   }
 
   joinRoom() {
-    this.socket.emit("join", {
+    const data = {
       room_code: this.roomCode,
       username: this.username,
-    });
+    };
+    if (this.lastSeq != null) {
+      data.last_seen_seq = this.lastSeq;
+    }
+    this.socket.emit("join", data);
   }
 
   leaveRoom() {
@@ -590,6 +696,7 @@ class ChatRoom {
     }
 
     this.socket.emit("send_message", { message });
+    this.lastTypingSent = 0; // the server clears typing state on send
     input.value = "";
     this.handleInputChange();
 
@@ -798,20 +905,51 @@ class ChatRoom {
     }
   }
 
+  async uploadImage(file) {
+    const response = await fetch(
+      `${CONFIG.BACKEND_URL}/api/rooms/${encodeURIComponent(
+        this.roomCode
+      )}/images`,
+      {
+        method: "POST",
+        headers: { "Content-Type": file.type || "application/octet-stream" },
+        body: file,
+      }
+    );
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.error || "Image upload failed");
+    }
+    return data;
+  }
+
+  imageUrl(imageId) {
+    return `${CONFIG.BACKEND_URL}/api/images/${encodeURIComponent(
+      imageId
+    )}?room=${encodeURIComponent(this.roomCode)}`;
+  }
+
   sendImageMessage() {
     if (this.pendingImages.length === 0) return;
 
     const messageInput = document.getElementById("message-input");
     const caption = messageInput.value.trim();
-
-    this.pendingImages.forEach((imageData, index) => {
-      setTimeout(() => {
-        this.socket.emit("send_message", {
-          message: index === 0 ? caption : "",
-          image: imageData.data,
-        });
-      }, index * 100);
-    });
+    const files = this.pendingImages.map((imageData) => imageData.file);
+
+    (async () => {
+      for (const [index, file] of files.entries()) {
+        try {
+          const upload = await this.uploadImage(file);
+          this.socket.emit("send_message", {
+            message: index === 0 ? caption : "",
+            image_id: upload.image_id,
+            thumbnail_id: upload.thumbnail_id,
+          });
+        } catch (error) {
+          this.showCustomToast(error.message, "error");
+        }
+      }
+    })();
 
     messageInput.value = "";
     this.closeImageModal(document.getElementById("image-preview-modal"));
@@ -829,11 +967,39 @@ class ChatRoom {
   displayMessage(messageData) {
     const container = document.getElementById("messages-container");
     if (!container) return;
+    if (messageData.seq != null) {
+      // Skip messages already shown from a history delta
+      if (this.lastSeq != null && messageData.seq <= this.lastSeq) return;
+      this.lastSeq = messageData.seq;
+    }
 
-    const isOwnMessage = messageData.username === this.username;
     const showUsername = this.lastSender !== messageData.username;
     this.lastSender = messageData.username;
 
+    container.appendChild(this.createMessageElement(messageData, showUsername));
+    container.scrollTop = container.scrollHeight;
+  }
+
+  prependHistory(messages) {
+    const container = document.getElementById("messages-container");
+    if (!container || messages.length === 0) return;
+
+    const fragment = document.createDocumentFragment();
+    let previousSender = null;
+    messages.forEach((messageData) => {
+      const showUsername = previousSender !== messageData.username;
+      previousSender = messageData.username;
+      fragment.appendChild(this.createMessageElement(messageData, showUsername));
+    });
+
+    const previousHeight = container.scrollHeight;
+    container.insertBefore(fragment, container.firstChild);
+    container.scrollTop += container.scrollHeight - previousHeight;
+  }
+
+  createMessageElement(messageData, showUsername) {
+    const isOwnMessage = messageData.username === this.username;
+
     const messageElement = document.createElement("div");
     messageElement.className = `message ${
       isOwnMessage ? "message-own" : "message-other"
@@ -844,16 +1010,29 @@ class ChatRoom {
       minute: "2-digit",
     });
 
+    const hasImage = Boolean(messageData.image_id || messageData.image);
     let imageHtml = "";
-    if (messageData.image) {
-      const imageSrc = messageData.image.startsWith("data:")
-        ? messageData.image
-        : `data:image/jpeg;base64,${messageData.image}`;
+    if (hasImage) {
+      let imageSrc;
+      let thumbnailSrc;
+      if (messageData.image_id) {
+        imageSrc = this.imageUrl(messageData.image_id);
+        thumbnailSrc = this.imageUrl(
+          messageData.thumbnail_id || messageData.image_id
+        );
+      } else {
+        imageSrc = messageData.image.startsWith("data:")
+          ? messageData.image
+          : `data:image/jpeg;base64,${messageData.image}`;
+        thumbnailSrc = imageSrc;
+      }
 
       imageHtml = `
               <div class="message-image-container">
-                  <img src="${imageSrc}" 
+                  <img src="${thumbnailSrc}" 
+                      data-full="${imageSrc}"
                       alt="Shared image" 
+                      loading="lazy"
                       class="message-image"
                       onclick="chatRoom.showFullImageFromMessage('${imageSrc}', this)">
                   ${
@@ -879,9 +1058,9 @@ class ChatRoom {
               : '<div class="message-username"></div>'
           }
           <div class="message-bubble">
-              ${messageData.image ? imageHtml : ""}
+              ${hasImage ? imageHtml : ""}
               ${
-                !messageData.image && messageData.message
+                !hasImage && messageData.message
                   ? `<div class="message-content">${formattedMessage}</div>`
                   : ""
               }
@@ -889,8 +1068,7 @@ class ChatRoom {
           </div>
       `;
 
-    container.appendChild(messageElement);
-    container.scrollTop = container.scrollHeight;
+    return messageElement;
   }
 
   linkifyWithNewlines(text) {
@@ -933,7 +1111,7 @@ class ChatRoom {
     messageElements.forEach((messageElement) => {
       const images = messageElement.querySelectorAll(".message-image");
       images.forEach((img) => {
-        allImages.push(img.src);
+        allImages.push(img.dataset.full || img.src);
       });
     });
 
@@ -1,10 +1,16 @@
-import secrets, random
+import os
+import sys
+import secrets
 from logging.config import dictConfig
 from flask import Flask, render_template, request, session, redirect, url_for
 from flask_socketio import join_room, leave_room, send, SocketIO
-from string import ascii_uppercase
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from assets import StaticAssets
+from engine import ChatEngine
+from store import MemoryRoomStore
+
 
 # ANSI escape codes for colors
 LAQUA = "\033[96m"    # Light Aqua
@@ -13,28 +19,30 @@ RESET = "\033[0m"     # Reset to default
 
 APPNAME, VERSION = "WhisperChat", "1.0.0"
 SECRET_KEY = secrets.token_hex(24)
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+HISTORY_MAX_MESSAGES = 500  # per room, shown on the room page
+HISTORY_MAX_BYTES = 512 * 1024  # of message text per room
 
 
 class WhisperChat:
     def __init__(self, host="127.0.0.1", port=8080):
-        self.app = Flask(f"{APPNAME} - v{VERSION}")
+        self.app = Flask(f"{APPNAME} - v{VERSION}", static_folder=None)
         self.app.config["SECRET_KEY"] = SECRET_KEY
         self.socketio = SocketIO(self.app)
         self.SERVER_HOST = host
         self.SERVER_PORT = port
-        self.rooms = {}
+        self.engine = ChatEngine(
+            MemoryRoomStore(HISTORY_MAX_MESSAGES, HISTORY_MAX_BYTES),
+            code_length=6,
+            page_size=HISTORY_MAX_MESSAGES,
+        )
+        self.assets = StaticAssets(STATIC_DIR)
 
         self.configure_logging()
         self.setup_routes()
-
-    def generate_unique_code(self, length):
-        while True:
-            code = ""
-            for _ in range(length):
-                code += random.choice(ascii_uppercase)
-            if code not in self.rooms:
-                break
-        return code
+        self.socketio.start_background_task(
+            self.engine.scheduler.run, sleep=self.socketio.sleep
+        )
     
     def configure_logging(self):
         dictConfig({
@@ -55,6 +63,16 @@ class WhisperChat:
         })
 
     def setup_routes(self):
+        @self.app.route("/static/<path:filename>", endpoint="static")
+        def static_file(filename):
+            return self.assets.serve(filename)
+
+        @self.app.url_defaults
+        def hashed_static_url(endpoint, values):
+            # Point templates at the content-hashed, long-cached file names
+            if endpoint == "static" and "filename" in values:
+                values["filename"] = self.assets.hashed(values["filename"])
+
         @self.app.route("/", methods=["POST", "GET"])
         def home():
             session.clear()
@@ -79,9 +97,8 @@ class WhisperChat:
 
                 room = code
                 if create != False:
-                    room = self.generate_unique_code(6)
-                    self.rooms[room] = {"members": 0, "messages": []}
-                elif code not in self.rooms:
+                    room = self.engine.create()
+                elif not self.engine.exists(code):
                     return render_template(
                         "home.html", error="Room does not exist.", code=code, name=name
                     )
@@ -95,22 +112,21 @@ class WhisperChat:
         @self.app.route("/room")
         def room():
             room = session.get("room")
-            if room is None or session.get("name") is None or room not in self.rooms:
+            if room is None or session.get("name") is None or not self.engine.exists(room):
                 return redirect(url_for("home"))
 
-            return render_template(
-                "room.html", code=room, messages=self.rooms[room]["messages"]
-            )
+            history, _ = self.engine.history(room)
+            messages = [{"name": m.username, "message": m.message} for m in history]
+            return render_template("room.html", code=room, messages=messages)
 
         @self.socketio.on("message")
         def message(data):
             room = session.get("room")
-            if room not in self.rooms:
+            if self.engine.post(room, session.get("name"), data["data"]) is None:
                 return
 
             content = {"name": session.get("name"), "message": data["data"]}
             send(content, to=room)
-            self.rooms[room]["messages"].append(content)
             print(f"{session.get('name')} said: {data['data']}")
 
         @self.socketio.on("connect")
@@ -119,13 +135,12 @@ class WhisperChat:
             name = session.get("name")
             if not room or not name:
                 return
-            if room not in self.rooms:
+            if self.engine.join(room) is None:
                 leave_room(room)
                 return
 
             join_room(room)
             send({"name": name, "message": "has entered the room"}, to=room)
-            self.rooms[room]["members"] += 1
             print(f"{name} joined room {room}")
 
         @self.socketio.on("disconnect")
@@ -134,10 +149,10 @@ class WhisperChat:
             name = session.get("name")
             leave_room(room)
 
-            if room in self.rooms:
-                self.rooms[room]["members"] -= 1
-                if self.rooms[room]["members"] <= 0:
-                    del self.rooms[room]
+            # The room outlives its last member for a while, so a page
+            # reload reconnects to it instead of finding it deleted
+            if room:
+                self.engine.leave(room)
 
             send({"name": name, "message": "has left the room"}, to=room)
             print(f"{name} has left the room {room}")